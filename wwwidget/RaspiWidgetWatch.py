@@ -9,19 +9,42 @@ Needs the package GPM installed on Linux to have mouse support
 """
 
 import argparse
+import collections
 import configparser
 import curses
 import logging.config
 import multiprocessing
+import os
+import pickle
+import selectors
 import signal
 import sys
+import time
 
-import multiprocessing_logging
 from widgetworkers import WidgetWorker
+from widgetworkers import curses_constants
+from widgetworkers import log_pipeline
+from widgetworkers.frame_buffer import FrameBuffer
+import render_server
+import widget_stats
 
 # create logger
 logger = logging.getLogger(__name__)
 
+# Shown in every widget until its first frame arrives
+PLACEHOLDER_TEXT = "Loading..."
+# Page of the widgets whose section has no page option
+DEFAULT_PAGE = "main"
+# Seconds between checks whether the config file changed, 0 turns it off
+DEFAULT_CONFIG_CHECK_INTERVAL = 5
+# Size of the in-memory screen with --headless, the 720x720 display with 12 px Terminus
+DEFAULT_HEADLESS_ROWS = 45
+DEFAULT_HEADLESS_COLS = 90
+# A widget whose rows can't be drawn is warned about at most once in this many seconds
+DRAW_ERROR_LOG_INTERVAL = 10
+# Options of the [wwwidget] section widgets are built with, changing one of them restarts every widget
+WIDGET_GLOBAL_OPTIONS = ("executor", "transport", "cache_dir", "fetch_timeout", "max_concurrent_fetches")
+
 
 def signal_handler(sig, frame):
     curses.endwin()
@@ -29,12 +52,49 @@ def signal_handler(sig, frame):
     sys.exit(0)
 
 
+def widget_signatures(config):
+    """
+    Returns what the widget of every widget section is built from, by section name. The page isn't part of it, a
+    widget moved to another page keeps running.
+    """
+    global_options = tuple(config.get("wwwidget", option, raw=True, fallback=None) for option in WIDGET_GLOBAL_OPTIONS)
+    return {section: (sorted((key, value) for key, value in config.items(section, raw=True) if key != "page"),
+                      global_options)
+            for section in config.sections() if WidgetWorker.is_config_section_valid_widget_worker(config[section])}
+
+
 class RaspiWidgetWatchController(object):
-    def __init__(self, config, screen):
+    def __init__(self, config, screen, input_file=sys.stdin, config_path=None):
         self.config = config
-        jobs = []
+        self.screen = screen
+        self.input_file = input_file
+        self.jobs = []
         self.widget_workers = {}
-        output_queue = multiprocessing.JoinableQueue()
+        # Config section -> name of the widget built from it
+        self.section_widgets = {}
+        # Widgets stopped by a config reload, their thread or process may still be running
+        self.stopped_widgets = []
+        # Curses windows are created once per widget and reused for every frame
+        self.widget_windows = {}
+        # Shadow buffers with the current content of every widget, the workers only send what changed
+        self.widget_buffers = {}
+        # Last label every widget sent, to draw its border when its page is shown
+        self.widget_labels = {}
+        # Widget name -> when a row of it couldn't be drawn and that was logged
+        self.draw_errors = {}
+        # Page name -> names of the widgets on it, in the order of the config. Only the current page is drawn, the
+        # widgets of all other pages are suspended.
+        self.pages = collections.OrderedDict()
+        self.current_page = None
+        self.output_queue = multiprocessing.JoinableQueue()
+        # Widgets using the shared memory transport write into their SharedFrame and ring this doorbell pipe
+        self.shared_frames = {}
+        self.doorbell_reader, self.doorbell_writer = os.pipe()
+        os.set_blocking(self.doorbell_reader, False)
+        os.set_blocking(self.doorbell_writer, False)
+        self.stats = widget_stats.StatsRegistry()
+        self.show_stats = False
+        self.stats_win = None
 
         screen.nodelay(True)
         curses.mousemask(curses.ALL_MOUSE_EVENTS)
@@ -42,109 +102,582 @@ class RaspiWidgetWatchController(object):
         curses.start_color()
         curses.use_default_colors()
 
-        for i in range(0, curses.COLORS):
-            curses.init_pair(i, i, -1)
-
-        curses.init_pair(8, curses.COLOR_BLUE, curses.COLOR_RED)
-        curses.init_pair(9, curses.COLOR_RED, curses.COLOR_BLUE)
+        # Color pair number -> (foreground, background), render clients get the colors from here as well
+        self.color_pairs = {i: (i, -1) for i in range(0, curses.COLORS)}
+        self.color_pairs[8] = (curses.COLOR_BLUE, curses.COLOR_RED)
+        self.color_pairs[9] = (curses.COLOR_RED, curses.COLOR_BLUE)
+        for pair_number, (foreground, background) in self.color_pairs.items():
+            curses.init_pair(pair_number, foreground, background)
 
         rows, cols = screen.getmaxyx()
         logger.info("Rows: {}, Cols: {}".format(rows, cols))
         logger.info("Can change color? {}".format(curses.can_change_color()))
         logger.info("COLORS {}, COLOR_PAIRS {}".format(curses.COLORS, curses.COLOR_PAIRS))
 
-        for section in self.config.sections():
-            if WidgetWorker.is_config_section_valid_widget_worker(self.config[section]):
-                widget_worker = WidgetWorker.instantiate_widget_from_configsection(self.config[section], output_queue)
-                self.widget_workers[widget_worker.name] = widget_worker
-                if widget_worker:
-                    jobs.append(widget_worker)
-                    widget_worker.start()
+        # The screen can be served to any number of terminal clients as well, see render_server
+        render_socket = self.config.get("wwwidget", "render_socket", fallback=None)
+        self.render_server = render_server.RenderServer(render_socket, rows, cols, self.color_pairs) \
+            if render_socket else None
 
+        for section in self.config.sections():
+            self.add_widget(self.config[section])
+        self.pages = self.build_pages()
+        self.current_page = next(iter(self.pages), None)
+        # Widgets on hidden pages start suspended and don't do anything until their page is shown
+        visible_widgets = self.pages.get(self.current_page, [])
+        for widget_name, widget_worker in self.widget_workers.items():
+            widget_worker.suspended = widget_name not in visible_widgets
+
+        # The first getch() would refresh the empty screen window over the placeholders, so that happens right now
+        screen.noutrefresh()
+        for widget_name in visible_widgets:
+            self.draw_widget(widget_name, self.widget_labels[widget_name])
+        self.update_screen()
+
+        # The screen is painted before any worker starts, the slow part of their setup (imports, loading fonts, fortune
+        # indices and feeds) happens in run(), in parallel
+        self.start_widgets(self.jobs)
+
+        self.hit_grid = self.build_hit_grid(rows, cols)
+
+        # The config is read again on SIGHUP and when the file changed, only widgets of changed sections are restarted
+        self.config_path = config_path
+        self.config_mtime = self.get_config_mtime()
+        self.reload_requested = False
+        self.config_check_interval = self.config.getfloat(
+            "wwwidget", "config_check_interval", fallback=DEFAULT_CONFIG_CHECK_INTERVAL) if config_path else 0
+        self.next_config_check = time.monotonic() + self.config_check_interval
+        if config_path:
+            signal.signal(signal.SIGHUP, self.request_reload)
+
+        # Runtime metrics are written as JSON on SIGUSR1 and optionally served on a Unix socket
+        self.stats_file = self.config.get("wwwidget", "stats_file", fallback="wwwidget_stats.json")
+        self.stats_dump_requested = False
+        signal.signal(signal.SIGUSR1, self.request_stats_dump)
+        stats_socket = self.config.get("wwwidget", "stats_socket", fallback=None)
+        if stats_socket:
+            self.stats.serve(stats_socket)
+
+        # Block until there is something to do instead of spinning on getch(): wake up on keys / GPM mouse events
+        # on stdin, when a worker wrote a frame into the pipe behind the output queue or rang the doorbell
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.input_file, selectors.EVENT_READ)
+        self.selector.register(self.output_queue._reader, selectors.EVENT_READ)
+        self.selector.register(self.doorbell_reader, selectors.EVENT_READ)
+
+    def add_widget(self, config_section):
+        """Builds the widget of a config section with a placeholder in its shadow buffer, but doesn't start it yet"""
+        if not WidgetWorker.is_config_section_valid_widget_worker(config_section):
+            return None
+        widget_worker = WidgetWorker.instantiate_widget_from_configsection(config_section, self.output_queue)
+        if not widget_worker:
+            return None
+        self.widget_workers[widget_worker.name] = widget_worker
+        self.section_widgets[config_section.name] = widget_worker.name
+        self.jobs.append(widget_worker)
+        self.widget_labels[widget_worker.name] = widget_worker.get_label()
+        if widget_worker.transport == "shared_memory":
+            self.shared_frames[widget_worker.name] = widget_worker.attach_shared_frame(self.doorbell_writer)
+        self.get_widget_buffer(widget_worker).addstr(0, 0, PLACEHOLDER_TEXT, curses_constants.A_DIM)
+        return widget_worker
+
+    def start_widgets(self, widget_workers):
+        # Processes are forked first: a process forked while a widget thread holds an import lock would wait for that
+        # lock forever
+        for widget_worker in sorted(widget_workers, key=lambda job: job.executor != "process"):
+            widget_worker.start()
+
+    def remove_widget(self, section):
+        """Stops the widget of a config section and forgets everything the controller kept for it"""
+        widget_name = self.section_widgets.pop(section)
+        widget_worker = self.widget_workers.pop(widget_name)
+        logger.info("Stopping {} of config section {}".format(widget_name, section))
+        widget_worker.stop()
+        self.jobs.remove(widget_worker)
+        self.stopped_widgets.append(widget_worker)
+        # Frames it still sends are dropped, its shared memory is released once it ended
+        self.shared_frames.pop(widget_name, None)
+        for widget_cache in (self.widget_windows, self.widget_buffers, self.widget_labels):
+            widget_cache.pop(widget_name, None)
+        self.stats.remove(widget_name)
+
+    def reap_stopped_widgets(self):
+        """Releases the shared memory of stopped widgets that ended, processes that didn't end yet are terminated"""
+        for widget_worker in list(self.stopped_widgets):
+            if widget_worker.is_running():
+                if widget_worker.executor != "process":
+                    # A thread can't be killed, it keeps its shared memory until it ends
+                    continue
+                logger.warning("{} didn't stop, terminating it".format(widget_worker.name))
+                widget_worker.terminate()
+            if widget_worker.shared_frame is not None:
+                widget_worker.shared_frame.close()
+            self.stopped_widgets.remove(widget_worker)
+        # Joins the processes that ended, so they don't linger as zombies
+        multiprocessing.active_children()
+
+    def build_pages(self):
+        """Returns page name -> names of the widgets on it, in the order of their config sections"""
+        pages = collections.OrderedDict()
+        for section in self.config.sections():
+            widget_name = self.section_widgets.get(section)
+            if widget_name is not None:
+                pages.setdefault(self.config[section].get("page", DEFAULT_PAGE), []).append(widget_name)
+        return pages
+
+    def get_config_mtime(self):
+        try:
+            return os.stat(self.config_path).st_mtime_ns if self.config_path else None
+        except OSError:
+            return None
+
+    def request_reload(self, sig, frame):
+        self.reload_requested = True
+        self.ring_doorbell()
+
+    def request_stats_dump(self, sig, frame):
+        # The loop writes the file, the signal may interrupt it while it holds the lock of the stats
+        self.stats_dump_requested = True
+        self.ring_doorbell()
+
+    def ring_doorbell(self):
+        """Wakes up the loop, safe to call from a signal handler"""
+        try:
+            os.write(self.doorbell_writer, b"\0")
+        except BlockingIOError:
+            pass
+
+    def config_changed(self):
+        """True if a reload was requested or the config file changed, its modification time is checked now and then"""
+        if self.reload_requested:
+            return True
+        if not self.config_check_interval or time.monotonic() < self.next_config_check:
+            return False
+        self.next_config_check = time.monotonic() + self.config_check_interval
+        return self.get_config_mtime() != self.config_mtime
+
+    def reload_config(self):
+        """
+        Reads the config file again and starts, stops or restarts only the widgets whose sections were added, removed
+        or changed. All other widgets keep running with their caches and last frames.
+        """
+        started = time.perf_counter()
+        self.reload_requested = False
+        self.config_mtime = self.get_config_mtime()
+        self.reap_stopped_widgets()
+        new_config = configparser.ConfigParser()
+        try:
+            new_config.read(self.config_path)
+        except configparser.Error as e:
+            logger.error("Not reloading {}: {}".format(self.config_path, e))
+            return
+        old_signatures, new_signatures = widget_signatures(self.config), widget_signatures(new_config)
+        if not new_signatures:
+            # Most likely read while an editor was writing it
+            logger.warning("Not reloading {}, it has no widget sections".format(self.config_path))
+            return
+
+        changed_sections = [section for section in list(old_signatures) + list(new_signatures)
+                            if old_signatures.get(section) != new_signatures.get(section)]
+        changed_sections = list(collections.OrderedDict.fromkeys(changed_sections))
+        previous_page = self.current_page
+        previously_visible = set(self.pages.get(self.current_page, []))
+        for section in changed_sections:
+            if section in self.section_widgets:
+                self.remove_widget(section)
+        self.config = new_config
+        added_widgets = [self.add_widget(new_config[section]) for section in changed_sections
+                         if section in new_signatures]
+        added_widgets = [widget_worker for widget_worker in added_widgets if widget_worker]
+
+        self.pages = self.build_pages()
+        if self.current_page not in self.pages:
+            self.current_page = next(iter(self.pages), None)
+        visible_widgets = self.pages.get(self.current_page, [])
+        for widget_name, widget_worker in self.widget_workers.items():
+            if widget_worker in added_widgets:
+                widget_worker.suspended = widget_name not in visible_widgets
+            elif widget_name in previously_visible and widget_name not in visible_widgets:
+                widget_worker.send_input(WidgetWorker.SUSPEND)
+            elif widget_name not in previously_visible and widget_name in visible_widgets:
+                widget_worker.send_input(WidgetWorker.RESUME)
+        self.start_widgets(added_widgets)
+        # Only a new page is repainted completely, otherwise curses sends just the cells that changed
+        self.redraw_page(clear_terminal=self.current_page != previous_page)
+        logger.info("Reloaded {} in {:.1f} ms: {} widgets stopped, {} started, {} kept running".format(
+            self.config_path, (time.perf_counter() - started) * 1000,
+            len([section for section in changed_sections if section in old_signatures]), len(added_widgets),
+            len(self.widget_workers) - len(added_widgets)))
+
+    def run(self):
         logger.info("Starting the loop now...")
 
+        try:
+            while True:
+                self.selector.select(self.config_check_interval or None)
+                if not self.handle_input():
+                    break
+                self.handle_output()
+                if self.stats_dump_requested:
+                    self.stats_dump_requested = False
+                    self.stats.dump_json(self.stats_file)
+                if self.config_changed():
+                    self.reload_config()
+        finally:
+            # Shared memory outlives the process unless it is unlinked
+            for shared_frame in self.shared_frames.values():
+                shared_frame.close()
+            for widget_worker in self.stopped_widgets:
+                if widget_worker.shared_frame is not None:
+                    widget_worker.shared_frame.close()
+            if self.render_server:
+                self.render_server.close()
+
+        logger.info("Ende der Fahnenstange!")
+        self.selector.close()
+        curses.endwin()
+
+    def handle_input(self):
+        """Drains all pending key and mouse events, returns False once the user wants to quit"""
         while True:
-            event = screen.getch()
+            event = self.screen.getch()
+            if event == -1:
+                return True
             if event == ord("q"):
                 logger.info("q pressed!")
-                break
+                return False
+            if event == ord("s"):
+                self.toggle_stats_overlay()
+            if event in (ord("n"), curses.KEY_RIGHT):
+                self.switch_page(1)
+            if event in (ord("p"), curses.KEY_LEFT):
+                self.switch_page(-1)
+            if ord("1") <= event <= ord("9") and event - ord("1") < len(self.pages):
+                self.show_page(list(self.pages)[event - ord("1")])
             if event == curses.KEY_MOUSE:
                 id, x, y, z, bstate = curses.getmouse()
                 logger.info("mouse event: id {}, x {}, y {}, z {}, bstate {}".format(id, x, y, z, bstate))
-
-                for widget_name, widget in self.widget_workers.items():
-                    logger.info("{}: {}".format(widget_name, widget.get_windows()[0].enclose(y, x)))
-                    widget.send_input(1)
-
-            if not output_queue.empty():
-                widget_name, widget_label, widget_output = output_queue.get_nowait()
-
-                widget = self.widget_workers[widget_name]
-                border_win, win = widget.get_windows()
-                win.clear()
-
-                border_win.border()
-                border_win.addstr(0, 2, widget_label)
-                border_win.refresh()
-
-                logger.debug("Received output from {}, {} lines".format(widget_name, len(widget_output)))
-                logger.debug(widget_output)
-
-                for y, output in enumerate(widget_output):
-                    try:
-                        action = output[0]
-                        parameters = output[1:]
-                        if action == 'addstr':
-                            #widget.win.addstr(*parameters)
-                            win.addstr(*parameters)
-                        elif action == 'bkgd':
-                            #widget.win.bkgd(*parameters)
-                            win.bkgd(*parameters)
-
-                    except Exception as e:
-                        # logger.warning("Error from widget {} printing line (length {}): {}".format(widget_name, len(line), line))
-                        logger.warning(e)
-
-                # widget.win.refresh()
-                win.refresh()
-
-
-
-        logger.info("Ende der Fahnenstange!")
-        curses.endwin()
-
-
-
-def main(screen):
+                self.dispatch_mouse_event(y, x, bstate)
+
+    def build_hit_grid(self, rows, cols):
+        """Returns a rows x cols grid with the name of the widget on each cell, later widgets cover earlier ones"""
+        hit_grid = [[None] * cols for _ in range(rows)]
+        for widget_name in self.pages.get(self.current_page, []):
+            widget = self.widget_workers[widget_name]
+            left, right = max(widget.x, 0), min(widget.x + widget.width, cols)
+            for y in range(max(widget.y, 0), min(widget.y + widget.height, rows)):
+                hit_grid[y][left:right] = [widget_name] * max(right - left, 0)
+        return hit_grid
+
+    def dispatch_mouse_event(self, y, x, bstate):
+        """Sends a mouse event to the widget under the cursor only, in coordinates relative to its content window"""
+        if not (0 <= y < len(self.hit_grid) and 0 <= x < len(self.hit_grid[y])):
+            return
+        widget_name = self.hit_grid[y][x]
+        if widget_name is None:
+            # A tap next to the widgets turns the page
+            if bstate & (curses.BUTTON1_CLICKED | curses.BUTTON1_PRESSED):
+                self.switch_page(1)
+            return
+        widget = self.widget_workers[widget_name]
+        mouse_event = WidgetWorker.MouseEvent(y - widget.y - 1, x - widget.x - 1, bstate)
+        logger.info("{}: {}".format(widget_name, mouse_event))
+        widget.send_input(mouse_event)
+
+    def handle_output(self):
+        """Empties the output queue and redraws every widget that published in the meantime, with one screen update"""
+        updated_widgets = {}
+        while not self.output_queue.empty():
+            message = self.output_queue.get_nowait()
+            if message[0] not in self.widget_workers:
+                # Sent by a widget that was stopped by a config reload
+                continue
+            # Every difference has to be applied to the shadow buffer, but each widget is drawn only once
+            widget_name, widget_label = self.receive_frame(message)
+            updated_widgets[widget_name] = widget_label
+
+        # The doorbell also wakes the loop up for a config reload, so it's emptied even without shared memory widgets
+        try:
+            while os.read(self.doorbell_reader, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        if self.shared_frames:
+            for widget_name in self.shared_frames:
+                widget_label = self.receive_shared_frame(widget_name)
+                if widget_label is not None:
+                    updated_widgets[widget_name] = widget_label
+
+        visible_widgets = self.pages.get(self.current_page, [])
+        for widget_name, widget_label in updated_widgets.items():
+            self.widget_labels[widget_name] = widget_label
+            # Frames of hidden widgets only update their shadow buffer, which is drawn when their page is shown
+            if widget_name in visible_widgets:
+                self.draw_widget(widget_name, widget_label)
+
+        if updated_widgets:
+            if self.show_stats:
+                self.draw_stats_overlay()
+            self.update_screen()
+
+    def receive_frame(self, message):
+        """Applies a frame from the output queue to its widget's shadow buffer, returns the widget's name and label"""
+        widget_name, widget_label, payload, sent_at, worker_render_seconds, replaced_frames = message
+        # The widget may send its next frame right away
+        self.widget_workers[widget_name].frame_received()
+        widget_output = pickle.loads(payload)
+        self.stats.record_frame(widget_name, len(payload), worker_render_seconds, sent_at)
+        if replaced_frames:
+            self.stats.record_dropped(widget_name, replaced_frames)
+        if log_pipeline.should_log_frame(widget_name):
+            logger.debug("Received output from {}, {} operations: {}".format(
+                widget_name, len(widget_output), widget_output))
+        self.get_widget_buffer(self.widget_workers[widget_name]).apply(widget_output)
+        return widget_name, widget_label
+
+    def receive_shared_frame(self, widget_name):
+        """Copies a new frame of a shared memory widget into its shadow buffer, returns its label or None"""
+        received = self.shared_frames[widget_name].receive(self.get_widget_buffer(self.widget_workers[widget_name]))
+        if received is None:
+            return None
+        widget_label, sent_at, worker_render_seconds, frame_bytes, skipped_frames = received
+        self.stats.record_frame(widget_name, frame_bytes, worker_render_seconds, sent_at)
+        if skipped_frames:
+            self.stats.record_dropped(widget_name, skipped_frames)
+        if log_pipeline.should_log_frame(widget_name):
+            logger.debug("Received shared frame from {}, {} bytes".format(widget_name, frame_bytes))
+        return widget_label
+
+    def switch_page(self, step):
+        if len(self.pages) > 1:
+            page_names = list(self.pages)
+            self.show_page(page_names[(page_names.index(self.current_page) + step) % len(page_names)])
+
+    def show_page(self, page):
+        """Suspends the widgets of the current page, resumes the ones of the new page and shows their last frames"""
+        if page == self.current_page:
+            return
+        logger.info("Showing page {}".format(page))
+        for widget_name in self.pages[self.current_page]:
+            self.widget_workers[widget_name].send_input(WidgetWorker.SUSPEND)
+        self.current_page = page
+        for widget_name in self.pages[page]:
+            self.widget_workers[widget_name].send_input(WidgetWorker.RESUME)
+        self.redraw_page(clear_terminal=True)
+
+    def redraw_page(self, clear_terminal):
+        """Draws all widgets of the current page again, with one screen update"""
+        if clear_terminal:
+            # clear() instead of erase() makes curses repaint the whole terminal, windows of the old page may overlap
+            # the new ones and curses would otherwise keep cells of them it believes unchanged
+            self.screen.clear()
+        else:
+            self.screen.erase()
+        self.screen.noutrefresh()
+        for widget_name in self.pages.get(self.current_page, []):
+            # The windows still hold what was drawn before, frames received since then are drawn from the shadow
+            # buffer
+            border_win, win = self.get_widget_windows(self.widget_workers[widget_name])
+            border_win.touchwin()
+            border_win.noutrefresh()
+            self.draw_widget(widget_name, self.widget_labels[widget_name])
+        if self.render_server:
+            self.composite_page()
+
+        rows, cols = self.screen.getmaxyx()
+        self.hit_grid = self.build_hit_grid(rows, cols)
+        if self.show_stats:
+            self.draw_stats_overlay()
+        self.update_screen()
+
+    def update_screen(self):
+        """Sends everything drawn since the last update to the terminal and to the render clients"""
+        curses.doupdate()
+        if self.render_server:
+            self.render_server.publish()
+
+    def composite_page(self):
+        """Draws the current page into the render server's screen model from scratch"""
+        self.render_server.screen.clear()
+        for widget_name in self.pages.get(self.current_page, []):
+            widget = self.widget_workers[widget_name]
+            self.composite_widget(widget, self.widget_labels[widget_name], range(widget.height - 2))
+
+    def composite_widget(self, widget, widget_label, rows):
+        """Draws rows of a widget into the render server's screen model, like its windows are drawn on the screen"""
+        screen_model = self.render_server.screen
+        screen_model.draw_box(widget.y, widget.x, widget.height, widget.width, widget_label)
+        screen_model.draw_frame(widget.y + 1, widget.x + 1, self.get_widget_buffer(widget), rows)
+
+    def toggle_stats_overlay(self):
+        self.show_stats = not self.show_stats
+        if self.show_stats:
+            self.draw_stats_overlay()
+        else:
+            # Bring back what the overlay covered
+            self.screen.touchwin()
+            self.screen.noutrefresh()
+            for widget_name in self.pages.get(self.current_page, []):
+                cached = self.widget_windows[widget_name]
+                cached["border_win"].touchwin()
+                cached["border_win"].noutrefresh()
+            if self.render_server:
+                self.composite_page()
+        self.update_screen()
+
+    def draw_stats_overlay(self):
+        """Draws the stats of all widgets into a window on top of them, without refreshing the screen yet"""
+        lines = self.stats.overlay_lines()
+        rows, cols = self.screen.getmaxyx()
+        height, width = min(len(lines) + 2, rows), min(max(len(line) for line in lines) + 2, cols)
+        top, left = (rows - height) // 2, (cols - width) // 2
+        if self.stats_win is None or self.stats_win.getmaxyx() != (height, width):
+            self.stats_win = curses.newwin(height, width, top, left)
+        self.stats_win.erase()
+        self.stats_win.border()
+        self.stats_win.addstr(0, 2, "Stats")
+        for y, line in enumerate(lines[:height - 2]):
+            self.stats_win.addstr(y + 1, 1, line[:width - 2])
+        self.stats_win.noutrefresh()
+        if self.render_server:
+            screen_model = self.render_server.screen
+            for y in range(top, top + height):
+                screen_model.put(y, left, " " * width)
+            screen_model.draw_box(top, left, height, width, "Stats")
+            for y, line in enumerate(lines[:height - 2]):
+                screen_model.put(top + y + 1, left + 1, line[:width - 2])
+
+    def get_widget_windows(self, widget):
+        """Returns the cached border and content window of a widget, they are only rebuilt if the geometry changed"""
+        geometry = (widget.x, widget.y, widget.width, widget.height)
+        cached = self.widget_windows.get(widget.name)
+        if cached is None or cached["geometry"] != geometry:
+            border_win, win = widget.get_windows()
+            cached = {"geometry": geometry, "border_win": border_win, "win": win, "label": None, "background": None}
+            self.widget_windows[widget.name] = cached
+            # A new window is empty, everything has to be drawn again from the shadow buffer
+            self.get_widget_buffer(widget).dirty_rows.update(range(widget.height - 2))
+        return cached["border_win"], cached["win"]
+
+    def draw_border(self, widget, widget_label):
+        """Redraws the border of a widget, but only if its label changed since the last time"""
+        cached = self.widget_windows[widget.name]
+        if cached["label"] == widget_label:
+            return
+        border_win = cached["border_win"]
+        border_win.border()
+        border_win.addstr(0, 2, widget_label)
+        border_win.noutrefresh()
+        cached["label"] = widget_label
+
+    def get_widget_buffer(self, widget):
+        width, height = widget.interior_space()
+        widget_buffer = self.widget_buffers.get(widget.name)
+        if widget_buffer is None or (widget_buffer.width, widget_buffer.height) != (width, height):
+            widget_buffer = FrameBuffer(width, height)
+            self.widget_buffers[widget.name] = widget_buffer
+        return widget_buffer
+
+    def draw_widget(self, widget_name, widget_label):
+        """Copies the changed rows of the widget's shadow buffer into its window, without refreshing the screen yet"""
+        started = time.perf_counter()
+        widget = self.widget_workers[widget_name]
+        border_win, win = self.get_widget_windows(widget)
+        self.draw_border(widget, widget_label)
+
+        widget_buffer = self.get_widget_buffer(widget)
+        dirty_rows = widget_buffer.pop_dirty_rows()
+        if widget_buffer.background != self.widget_windows[widget_name]["background"]:
+            win.bkgd(*(widget_buffer.background or (" ", 0)))
+            self.widget_windows[widget_name]["background"] = widget_buffer.background
+
+        # The shadow buffer is clipped to the window already, only the bottom right corner needs care: addstr()
+        # fails there because the cursor can't move past it, insstr() doesn't move the cursor
+        corner = (widget_buffer.height - 1, widget_buffer.width)
+        for y in dirty_rows:
+            win.move(y, 0)
+            win.clrtoeol()
+            for x, text, attr in widget_buffer.row_runs(y):
+                try:
+                    if (y, x + len(text)) == corner:
+                        if len(text) > 1:
+                            win.addstr(y, x, text[:-1], attr)
+                        win.insstr(y, corner[1] - 1, text[-1], attr)
+                    else:
+                        win.addstr(y, x, text, attr)
+                except curses.error as e:
+                    # E.g. wide characters take two cells and run past the window, the rest is drawn anyway
+                    self.log_draw_error(widget_name, y, text, e)
+
+        win.noutrefresh()
+        if self.render_server:
+            self.composite_widget(widget, widget_label, dirty_rows)
+        self.stats.record_draw(widget_name, time.perf_counter() - started)
+
+    def log_draw_error(self, widget_name, y, text, error):
+        now = time.monotonic()
+        last = self.draw_errors.get(widget_name)
+        if last is not None and now - last < DRAW_ERROR_LOG_INTERVAL:
+            return
+        self.draw_errors[widget_name] = now
+        logger.warning("{} row {} can't be drawn ({}): {!r}".format(widget_name, y, error, text))
+
+
+def start_headless(config):
+    """Replaces curses with the in-memory screen of fake_curses, the render clients are the only displays then"""
+    global curses
+    import fake_curses
+    curses = fake_curses
+    WidgetWorker.curses = fake_curses
+    return fake_curses.FakeScreen(config.getint("wwwidget", "headless_rows", fallback=DEFAULT_HEADLESS_ROWS),
+                                  config.getint("wwwidget", "headless_cols", fallback=DEFAULT_HEADLESS_COLS))
+
+
+def main(screen, args):
     signal.signal(signal.SIGINT, signal_handler)
 
-    parser = argparse.ArgumentParser(description='Run a collection of informational and silly widgets in the terminal')
-    parser.add_argument('configfile', help='Mandatory Configfile')
-    args = parser.parse_args()
-
     #logging.config.fileConfig(args.configfile)
 
-    logging.basicConfig(filename='example.log',
-                        filemode='w',
-                        level=logging.DEBUG,
-                        format='%(asctime)s - %(levelname)s - %(message)s',
-                        datefmt='%m/%d/%Y %I:%M:%S %p')
+    config = configparser.ConfigParser()
+    config.read(args.configfile)
+
+    input_file = sys.stdin
+    if screen is None:
+        if not config.get("wwwidget", "render_socket", fallback=None):
+            sys.exit("--headless needs render_socket in the [wwwidget] section of {}".format(args.configfile))
+        screen = start_headless(config)
+        # Without a terminal stdin may be /dev/null, a pipe at its end or the shell it was started from
+        input_file = screen.input_file
 
-    multiprocessing_logging.install_mp_handler()
+    log_listener = log_pipeline.start_logging(config)
 
     logger = logging.getLogger(__name__)
     logger.info("Starting now...")
 
-    config = configparser.ConfigParser()
-    config.read(args.configfile)
     logger.info("Color Pair 0: " + str(curses.color_pair(0)))
     logger.info("Color Pair 1: " + str(curses.color_pair(1)))
     logger.info("Color Pair 2: " + str(curses.color_pair(2)))
-    controller = RaspiWidgetWatchController(config, screen)
+    try:
+        controller = RaspiWidgetWatchController(config, screen, input_file=input_file, config_path=args.configfile)
+        controller.run()
+    except Exception:
+        # Still through the listener, it is stopped right after
+        logger.error("Fatal error in main loop", exc_info=True)
+        raise
+    finally:
+        log_listener.stop()
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a collection of informational and silly widgets in the terminal')
+    parser.add_argument('configfile', help='Mandatory Configfile')
+    parser.add_argument('--headless', action='store_true',
+                        help="Don't use this terminal, only serve the screen to render clients")
+    args = parser.parse_args()
     try:
-        curses.wrapper(main)
+        if args.headless:
+            main(None, args)
+        else:
+            curses.wrapper(main, args)
     except Exception:
         logger.error("Fatal error in main loop", exc_info=True)
@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Headless benchmark of the RaspiWidgetWatchController.
+
+Runs the controller against the in-memory screen from fake_curses with synthetic and real widgets and reports
+frames/s, worker to screen latency percentiles, CPU usage of the controller and memory per worker.
+
+    python benchmark.py --scenario all --duration 10
+    python benchmark.py --scenario synthetic --executor process --json
+    python benchmark.py --scenario synthetic --executor process --transport shared_memory
+"""
+
+import argparse
+import configparser
+import email.utils
+import json
+import logging
+import os
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import fake_curses
+import RaspiWidgetWatch
+import widget_stats
+from widgetworkers import WidgetWorker
+
+SCENARIOS = ("synthetic", "clocks", "fortunes", "feeds", "mixed")
+SCREEN_ROWS = 45
+SCREEN_COLS = 90
+
+
+class SyntheticWorker(WidgetWorker.WidgetWorker):
+    """Publishes a counter every interval seconds, the benchmark's stand-in for a fast widget"""
+
+    def __init__(self, output_queue, x, y, width, height, interval=0.1, label="Synthetic"):
+        WidgetWorker.WidgetWorker.__init__(self, output_queue, x, y, width, height)
+        self.interval = interval
+        self.label = label
+
+    @classmethod
+    def InstanceFromConfigSection(cls, configsection, output_queue):
+        instance = cls(
+            output_queue=output_queue,
+            x=configsection.getint("x"),
+            y=configsection.getint("y"),
+            width=configsection.getint("width"),
+            height=configsection.getint("height"),
+            interval=configsection.getfloat("interval", 0.1),
+            label=configsection.get("label"),
+        )
+        return instance
+
+    def run(self):
+        counter = 0
+        width, height = self.interior_space()
+        while True:
+            if not self.suspended:
+                counter += 1
+                frame = self.new_frame()
+                for y in range(height):
+                    frame.addstr(y, 0, "{} {:>8}".format(self.label, counter * (y + 1)))
+                self.send_frame(frame)
+            try:
+                self.handle_input(self.input_queue.get(timeout=None if self.suspended else self.interval))
+            except queue.Empty:
+                pass
+
+
+class BenchmarkStats(widget_stats.StatsRegistry):
+    """Remembers when the frames received since the last screen update were sent, whatever their transport"""
+
+    def __init__(self):
+        widget_stats.StatsRegistry.__init__(self)
+        self.frames = 0
+        self.pending_sent_at = []
+
+    def record_frame(self, widget_name, frame_bytes, worker_render_seconds, sent_at):
+        self.frames += 1
+        self.pending_sent_at.append(sent_at)
+        widget_stats.StatsRegistry.record_frame(self, widget_name, frame_bytes, worker_render_seconds, sent_at)
+
+
+class BenchmarkController(RaspiWidgetWatch.RaspiWidgetWatchController):
+    """Controller which records when every frame was sent and when it reached the screen"""
+
+    def __init__(self, config, screen):
+        self.latencies = []
+        RaspiWidgetWatch.RaspiWidgetWatchController.__init__(self, config, screen, input_file=screen.input_file)
+        # Nothing was received yet, the widgets only just started
+        self.stats = BenchmarkStats()
+
+    @property
+    def frames(self):
+        return self.stats.frames
+
+    def handle_output(self):
+        RaspiWidgetWatch.RaspiWidgetWatchController.handle_output(self)
+        now = time.time()
+        self.latencies.extend(now - sent_at for sent_at in self.stats.pending_sent_at)
+        self.stats.pending_sent_at = []
+
+
+def write_fortune_file(path, count=2000):
+    with open(path, "w") as file_out:
+        for i in range(count):
+            lines = ["Fortune cookie number {} says hello".format(i)] * (1 + i % 7)
+            file_out.write("\n".join(lines) + "\n%\n")
+
+
+def write_feed_file(path, count=200):
+    items = "".join(
+        "<item><title>Story {0}</title><link>http://localhost/{0}</link><guid>story-{0}</guid>"
+        "<pubDate>{1}</pubDate></item>".format(i, email.utils.formatdate(1600000000 + i * 60, usegmt=True))
+        for i in range(count))
+    with open(path, "w") as file_out:
+        file_out.write("<?xml version='1.0'?><rss version='2.0'><channel><title>Benchmark</title>{}</channel></rss>"
+                       .format(items))
+
+
+def build_config(scenario, executor, transport, synthetic_widgets, synthetic_interval, work_dir):
+    config = configparser.ConfigParser(interpolation=None)
+    config["wwwidget"] = {"cache_dir": os.path.join(work_dir, "cache"), "transport": transport}
+    if executor:
+        config["wwwidget"]["executor"] = executor
+
+    fortune_file = os.path.join(work_dir, "fortunes")
+    feed_file = os.path.join(work_dir, "feed.rss")
+    write_fortune_file(fortune_file)
+    write_feed_file(feed_file)
+
+    sections = []
+    if scenario in ("synthetic", "mixed"):
+        for i in range(synthetic_widgets):
+            sections.append(("SyntheticWorker_{}".format(i), 30, 5,
+                             {"interval": str(synthetic_interval), "label": "Synthetic {}".format(i)}))
+    if scenario in ("clocks", "mixed"):
+        for i, time_format in enumerate(["%H:%M:%S", "%H:%M:%S", "%H:%M", "%H:%M:%S"]):
+            sections.append(("WorldClockWorker_{}".format(i), 60, 8,
+                             {"destination_timezone": "Europe/Zurich", "label": "Clock {}".format(i),
+                              "time_format": time_format}))
+    if scenario in ("fortunes", "mixed"):
+        for i in range(3):
+            sections.append(("FortuneWorker_{}".format(i), 45, 9,
+                             {"fortune_file": fortune_file, "label": "Fortune {}".format(i)}))
+    if scenario in ("feeds", "mixed"):
+        for i in range(3):
+            sections.append(("FeedReaderWorker_{}".format(i), 90, 8,
+                             {"feed_url": feed_file, "refresh_interval_mins": "1", "label": "Feed {}".format(i)}))
+
+    # Fill the screen row by row, widgets that don't fit anymore are placed off screen like on a real dashboard
+    x, y, row_height = 0, 0, 0
+    for name, width, height, options in sections:
+        if x + width > SCREEN_COLS:
+            x, y, row_height = 0, y + row_height, 0
+        config[name] = dict(options, x=str(x), y=str(y), width=str(width), height=str(height))
+        x += width
+        row_height = max(row_height, height)
+    return config
+
+
+def rss_kb(pid):
+    try:
+        with open("/proc/{}/status".format(pid)) as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def run_scenario(scenario, executor, transport, duration, synthetic_widgets, synthetic_interval, click_interval):
+    RaspiWidgetWatch.curses = fake_curses
+    WidgetWorker.curses = fake_curses
+
+    work_dir = tempfile.mkdtemp(prefix="wwwidget-benchmark-")
+    config = build_config(scenario, executor, transport, synthetic_widgets, synthetic_interval, work_dir)
+    screen = fake_curses.FakeScreen(SCREEN_ROWS, SCREEN_COLS)
+
+    start_wall = time.time()
+    start_times = os.times()
+    controller = BenchmarkController(config, screen)
+    startup_seconds = time.time() - start_wall
+    memory = {}
+
+    def drive():
+        end = time.time() + duration
+        # Tap the fortune widgets now and then, so the input path is exercised as well
+        while time.time() < end:
+            time.sleep(min(click_interval, max(end - time.time(), 0)))
+            for widget in controller.widget_workers.values():
+                if isinstance(widget, WidgetWorker.FortuneWorker):
+                    screen.click(widget.y + 2, widget.x + 2)
+        memory["controller"] = rss_kb(os.getpid())
+        for widget_name, widget in controller.widget_workers.items():
+            if widget.executor == "process":
+                memory[widget_name] = rss_kb(widget.pid)
+        screen.press("q")
+
+    driver = threading.Thread(target=drive, daemon=True)
+    driver.start()
+    loop_start_wall = time.time()
+    loop_start_cpu = time.thread_time()
+    controller.run()
+    loop_cpu = time.thread_time() - loop_start_cpu
+    wall = time.time() - loop_start_wall
+    end_times = os.times()
+
+    for widget in controller.widget_workers.values():
+        if widget.executor == "process" and widget.is_alive():
+            widget.terminate()
+
+    latencies_ms = [latency * 1000 for latency in controller.latencies]
+    return {
+        "scenario": scenario,
+        "executor": executor or "default",
+        "transport": transport,
+        "widgets": len(controller.widget_workers),
+        "startup_ms": round(startup_seconds * 1000, 1),
+        "duration_s": round(wall, 2),
+        "frames": controller.frames,
+        "frames_per_s": round(controller.frames / wall, 1),
+        "screen_updates_per_s": round(fake_curses.terminal.updates / wall, 1),
+        "cells_written_per_s": round(fake_curses.terminal.cells_written / wall, 1),
+        "latency_ms_p50": percentile(latencies_ms, 0.5),
+        "latency_ms_p90": percentile(latencies_ms, 0.9),
+        "latency_ms_p99": percentile(latencies_ms, 0.99),
+        "latency_ms_max": max(latencies_ms) if latencies_ms else None,
+        "controller_loop_cpu_percent": round(100 * loop_cpu / wall, 1),
+        "controller_process_cpu_percent": round(
+            100 * ((end_times.user + end_times.system) - (start_times.user + start_times.system)) / wall, 1),
+        "rss_kb": memory,
+    }
+
+
+def format_result(result):
+    lines = ["{scenario} ({executor} executor, {transport} transport, {widgets} widgets, startup {startup_ms} ms)"
+             .format(**result)]
+    for key, value in result.items():
+        if key in ("scenario", "executor", "transport", "widgets", "startup_ms", "rss_kb"):
+            continue
+        if isinstance(value, float) and key.startswith("latency"):
+            value = round(value, 2)
+        lines.append("  {:<32} {}".format(key, value))
+    lines.append("  {:<32} {}".format("rss_kb", ", ".join("{}={}".format(k, v) for k, v in result["rss_kb"].items())))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the widget controller against a fake curses screen")
+    parser.add_argument("--scenario", choices=SCENARIOS + ("all",), default="all")
+    parser.add_argument("--executor", choices=WidgetWorker.EXECUTORS,
+                        help="Executor for all widgets, by default every widget uses its own default")
+    parser.add_argument("--transport", choices=WidgetWorker.TRANSPORTS, default="queue")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds to run every scenario")
+    parser.add_argument("--synthetic-widgets", type=int, default=6)
+    parser.add_argument("--synthetic-interval", type=float, default=0.1, help="Seconds between synthetic frames")
+    parser.add_argument("--click-interval", type=float, default=1.0, help="Seconds between taps on fortune widgets")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    if args.scenario == "all":
+        # Every scenario runs in a fresh interpreter, so widget threads of one scenario don't disturb the next one
+        results = []
+        for scenario in SCENARIOS:
+            command = [sys.executable, os.path.abspath(__file__), "--scenario", scenario, "--json",
+                       "--transport", args.transport, "--duration", str(args.duration),
+                       "--synthetic-widgets", str(args.synthetic_widgets),
+                       "--synthetic-interval", str(args.synthetic_interval),
+                       "--click-interval", str(args.click_interval), "--log-level", args.log_level]
+            if args.executor:
+                command += ["--executor", args.executor]
+            output = subprocess.run(command, check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+            results.append(json.loads(output))
+    else:
+        results = [run_scenario(args.scenario, args.executor, args.transport, args.duration, args.synthetic_widgets,
+                                args.synthetic_interval, args.click_interval)]
+
+    if args.json:
+        print(json.dumps(results[0] if len(results) == 1 and args.scenario != "all" else results, indent=2))
+    else:
+        print("\n\n".join(format_result(result) for result in results))
+    sys.stdout.flush()
+    # Widget threads never return on their own
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+In-memory stand-in for the parts of the curses module the controller uses, so it can run without a terminal.
+
+Windows write into a virtual screen on noutrefresh(), doupdate() copies the virtual screen to the "physical" one and
+counts how many cells changed, which is about what curses would have to send to a real terminal.
+Keys are read from a pipe, write to FakeScreen.input_writer to press them.
+"""
+
+import os
+
+from widgetworkers import curses_constants
+
+A_BLINK = curses_constants.A_BLINK
+A_BOLD = curses_constants.A_BOLD
+A_REVERSE = curses_constants.A_REVERSE
+A_STANDOUT = curses_constants.A_STANDOUT
+A_DIM = curses_constants.A_DIM
+A_UNDERLINE = curses_constants.A_UNDERLINE
+A_COLOR = curses_constants.A_COLOR
+A_NORMAL = 0
+
+ALL_MOUSE_EVENTS = 0x7ffffff
+KEY_LEFT = 260
+KEY_RIGHT = 261
+KEY_MOUSE = 409
+KEY_RESIZE = 410
+BUTTON1_PRESSED = 2
+BUTTON1_CLICKED = 4
+COLORS = 8
+COLOR_PAIRS = 64
+COLOR_BLACK, COLOR_RED, COLOR_GREEN, COLOR_YELLOW, COLOR_BLUE, COLOR_MAGENTA, COLOR_CYAN, COLOR_WHITE = range(8)
+
+
+class error(Exception):
+    pass
+
+
+class FakeTerminal(object):
+    def __init__(self, rows, cols):
+        self.rows = rows
+        self.cols = cols
+        self.virtual = [[(" ", 0)] * cols for _ in range(rows)]
+        self.physical = [[(" ", 0)] * cols for _ in range(rows)]
+        self.updates = 0
+        self.cells_written = 0
+        self.mouse_events = []
+
+    def doupdate(self):
+        self.updates += 1
+        for y in range(self.rows):
+            virtual_row, physical_row = self.virtual[y], self.physical[y]
+            if virtual_row != physical_row:
+                self.cells_written += sum(1 for v, p in zip(virtual_row, physical_row) if v != p)
+                self.physical[y] = list(virtual_row)
+
+    def text(self):
+        return "\n".join("".join(ch for ch, attr in row).rstrip() for row in self.physical)
+
+
+terminal = FakeTerminal(45, 90)
+
+
+class FakeWindow(object):
+    def __init__(self, height, width, y, x, parent=None):
+        self.height = height
+        self.width = width
+        self.y = y
+        self.x = x
+        # Derived windows share the cells of their parent, like in curses
+        if parent is None:
+            self.cells = [[(" ", 0)] * width for _ in range(height)]
+            self.offset_y, self.offset_x = 0, 0
+            self.root = self
+        else:
+            self.cells = parent.root.cells
+            self.offset_y, self.offset_x = parent.offset_y + y - parent.y, parent.offset_x + x - parent.x
+            self.root = parent.root
+        self.background = (" ", 0)
+        self.cursor = (0, 0)
+
+    def derwin(self, height, width, y, x):
+        return FakeWindow(height, width, self.y + y, self.x + x, self)
+
+    def getmaxyx(self):
+        return self.height, self.width
+
+    def enclose(self, y, x):
+        return self.y <= y < self.y + self.height and self.x <= x < self.x + self.width
+
+    def _put(self, y, x, ch, attr):
+        self.root.cells[self.offset_y + y][self.offset_x + x] = (ch, attr)
+
+    def addstr(self, y, x, text, attr=0):
+        if not (0 <= y < self.height and 0 <= x < self.width):
+            raise error("addstr() returned ERR")
+        for ch in text:
+            if x >= self.width:
+                y, x = y + 1, 0
+            if y >= self.height:
+                raise error("addstr() returned ERR")
+            self._put(y, x, ch, attr)
+            x += 1
+        if (y, x) == (self.height - 1, self.width):
+            raise error("addstr() returned ERR")
+        self.cursor = (y, x)
+
+    def insstr(self, y, x, text, attr=0):
+        for ch in text[:self.width - x]:
+            self._put(y, x, ch, attr)
+            x += 1
+
+    def border(self, *args):
+        for x in range(self.width):
+            self._put(0, x, "-", 0)
+            self._put(self.height - 1, x, "-", 0)
+        for y in range(self.height):
+            self._put(y, 0, "|", 0)
+            self._put(y, self.width - 1, "|", 0)
+
+    def bkgd(self, ch, attr=0):
+        self.background = (ch, attr)
+
+    def move(self, y, x):
+        self.cursor = (y, x)
+
+    def clrtoeol(self):
+        y, x = self.cursor
+        for column in range(x, self.width):
+            self._put(y, column, self.background[0], self.background[1])
+
+    def erase(self):
+        for y in range(self.height):
+            for x in range(self.width):
+                self._put(y, x, self.background[0], self.background[1])
+
+    def clear(self):
+        self.erase()
+
+    def touchwin(self):
+        pass
+
+    def noutrefresh(self):
+        for y in range(self.height):
+            screen_y = self.y + y
+            if not 0 <= screen_y < terminal.rows:
+                continue
+            row = self.root.cells[self.offset_y + y]
+            for x in range(self.width):
+                screen_x = self.x + x
+                if 0 <= screen_x < terminal.cols:
+                    terminal.virtual[screen_y][screen_x] = row[self.offset_x + x]
+
+    def refresh(self):
+        self.noutrefresh()
+        doupdate()
+
+
+class FakeScreen(FakeWindow):
+    def __init__(self, rows, cols):
+        global terminal
+        terminal = FakeTerminal(rows, cols)
+        FakeWindow.__init__(self, rows, cols, 0, 0)
+        input_reader, input_writer = os.pipe()
+        os.set_blocking(input_reader, False)
+        self.input_file = os.fdopen(input_reader, "rb", buffering=0)
+        self.input_writer = os.fdopen(input_writer, "wb", buffering=0)
+
+    def nodelay(self, flag):
+        pass
+
+    def keypad(self, flag):
+        pass
+
+    def getch(self):
+        key = self.input_file.read(1)
+        if not key:
+            return -1
+        if key == b"\x00" and terminal.mouse_events:
+            return KEY_MOUSE
+        return key[0]
+
+    def click(self, y, x, bstate=4):
+        """Queues a mouse click, like GPM would report it"""
+        terminal.mouse_events.append((0, x, y, 0, bstate))
+        self.input_writer.write(b"\x00")
+
+    def press(self, key):
+        self.input_writer.write(key.encode("utf-8"))
+
+
+def newwin(height, width, y=0, x=0):
+    return FakeWindow(height, width, y, x)
+
+
+def doupdate():
+    terminal.doupdate()
+
+
+def getmouse():
+    if not terminal.mouse_events:
+        raise error("getmouse() returned ERR")
+    return terminal.mouse_events.pop(0)
+
+
+def mousemask(mask):
+    return mask, 0
+
+
+def curs_set(visibility):
+    return 1
+
+
+def start_color():
+    pass
+
+
+def use_default_colors():
+    pass
+
+
+def init_pair(pair_number, fg, bg):
+    pass
+
+
+def color_pair(pair_number):
+    return pair_number << 8
+
+
+def can_change_color():
+    return False
+
+
+def endwin():
+    pass
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Shows the screen served by a RaspiWidgetWatch controller with render_socket set, without running any widget itself.
+
+    python render_client.py /tmp/wwwidget_render.sock
+    python render_client.py raspberrypi.local:7000
+
+Press q to quit.
+"""
+
+import argparse
+import os
+import selectors
+import socket
+import sys
+import termios
+import tty
+
+
+def connect(address):
+    """Connects over TCP if the address looks like host:port, otherwise to a Unix socket"""
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        return socket.create_connection((host, int(port)))
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(address)
+    return client
+
+
+def show(client, output_fd, input_fd):
+    """Copies the screen updates to the terminal until the server goes away or q is pressed"""
+    selector = selectors.DefaultSelector()
+    selector.register(client, selectors.EVENT_READ)
+    selector.register(input_fd, selectors.EVENT_READ)
+    while True:
+        for key, _ in selector.select():
+            if key.fileobj is client:
+                data = client.recv(65536)
+                if not data:
+                    return "The server closed the connection"
+                os.write(output_fd, data)
+            elif b"q" in os.read(input_fd, 1024):
+                return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the screen of a RaspiWidgetWatch controller")
+    parser.add_argument("address", help="render_socket of the controller, a Unix socket path or host:port")
+    args = parser.parse_args()
+
+    client = connect(args.address)
+    input_fd, output_fd = sys.stdin.fileno(), sys.stdout.fileno()
+    terminal_settings = termios.tcgetattr(input_fd)
+    # Alternate screen and no cursor, keys are neither echoed nor wait for return
+    os.write(output_fd, b"\x1b[?1049h\x1b[?25l")
+    tty.setcbreak(input_fd)
+    try:
+        message = show(client, output_fd, input_fd)
+    finally:
+        termios.tcsetattr(input_fd, termios.TCSADRAIN, terminal_settings)
+        os.write(output_fd, b"\x1b[0m\x1b[?25h\x1b[?1049l")
+        client.close()
+    if message:
+        print(message)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Serves the screen of the controller to any number of terminal clients, so the widgets run and the feeds are fetched
+only once, however many displays are attached.
+
+The controller draws every widget into a ScreenModel as well. After each screen update the cells that changed are
+sent to all clients as ANSI escape sequences, a client that just connected gets the whole screen first.
+Clients connect to render_socket of the [wwwidget] section, a Unix socket path or host:port for TCP, e.g. with
+render_client.py.
+"""
+
+import logging
+import os
+import selectors
+import socket
+import threading
+
+from widgetworkers import curses_constants
+from widgetworkers.frame_buffer import MAX_UNCHANGED_GAP
+
+logger = logging.getLogger(__name__)
+
+# A client that lags behind by more than this many bytes gets the whole screen again instead of every change
+MAX_PENDING_BYTES = 256 * 1024
+
+# Attribute -> SGR parameter, A_STANDOUT looks like A_REVERSE on most terminals
+SGR_ATTRIBUTES = ((curses_constants.A_BOLD, "1"), (curses_constants.A_DIM, "2"), (curses_constants.A_UNDERLINE, "4"),
+                  (curses_constants.A_BLINK, "5"), (curses_constants.A_REVERSE, "7"),
+                  (curses_constants.A_STANDOUT, "7"))
+# CAN aborts an escape sequence a lagging client may have got only half of, then the screen is erased
+SNAPSHOT_PREFIX = "\x18\x1b[0m\x1b[2J"
+
+
+def color_parameters(color, base):
+    """SGR parameters of a curses color number, base is 30 for the foreground and 40 for the background"""
+    if color < 0:
+        return []
+    if color < 8:
+        return [str(base + color)]
+    if color < 16:
+        return [str(base + 60 + color - 8)]
+    return [str(base + 8), "5", str(color)]
+
+
+def open_listener(address):
+    """Listens on TCP if the address looks like host:port, otherwise on a Unix socket"""
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((host, int(port)))
+    else:
+        if os.path.exists(address):
+            os.unlink(address)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(address)
+    listener.listen(8)
+    return listener
+
+
+class ScreenModel(object):
+    """
+    Characters and attributes of the whole screen, composited by the controller like curses composites its windows.
+    Besides the cells the controller draws into it keeps the cells last sent to the clients.
+    """
+
+    def __init__(self, rows, cols, color_pairs):
+        self.rows = rows
+        self.cols = cols
+        self.color_pairs = color_pairs
+        self.chars = [[" "] * cols for _ in range(rows)]
+        self.attrs = [[0] * cols for _ in range(rows)]
+        self.sent_chars = [[" "] * cols for _ in range(rows)]
+        self.sent_attrs = [[0] * cols for _ in range(rows)]
+        self.dirty_rows = set()
+        self.sgr_cache = {}
+
+    def put(self, y, x, text, attr=0):
+        """Writes text at a screen position, everything outside of the screen is clipped"""
+        if not 0 <= y < self.rows or x >= self.cols:
+            return
+        if x < 0:
+            text = text[-x:]
+            x = 0
+        text = text[:self.cols - x]
+        if not text:
+            return
+        self.chars[y][x:x + len(text)] = text
+        self.attrs[y][x:x + len(text)] = [attr] * len(text)
+        self.dirty_rows.add(y)
+
+    def clear(self):
+        for y in range(self.rows):
+            self.put(y, 0, " " * self.cols)
+
+    def draw_box(self, y, x, height, width, label):
+        """Draws a border like curses' border() and the label in its top line"""
+        if height < 2 or width < 2:
+            return
+        self.put(y, x, "┌" + "─" * (width - 2) + "┐")
+        for row in range(y + 1, y + height - 1):
+            self.put(row, x, "│")
+            self.put(row, x + width - 1, "│")
+        self.put(y + height - 1, x, "└" + "─" * (width - 2) + "┘")
+        self.put(y, x + 2, label[:max(width - 3, 0)])
+
+    def draw_frame(self, y, x, frame_buffer, rows):
+        """Copies rows of a widget's shadow buffer to the screen position of its content window"""
+        background_char, background_attr = frame_buffer.background or (" ", 0)
+        if isinstance(background_char, int):
+            background_char = chr(background_char)
+        for row in rows:
+            text = frame_buffer.rows[row]
+            if background_char != " ":
+                text = text.replace(" ", background_char)
+            for run_x, run_text, attr in self.runs(text, frame_buffer.attrs[row]):
+                self.put(y + row, x + run_x, run_text, attr | background_attr)
+
+    @staticmethod
+    def runs(text, attrs):
+        runs = []
+        x = 0
+        while x < len(text):
+            run_end = x + 1
+            while run_end < len(text) and attrs[run_end] == attrs[x]:
+                run_end += 1
+            runs.append((x, text[x:run_end], attrs[x]))
+            x = run_end
+        return runs
+
+    def sgr(self, attr):
+        """Escape sequence which switches the terminal to a curses attribute, including its color pair"""
+        sequence = self.sgr_cache.get(attr)
+        if sequence is None:
+            parameters = ["0"] + [parameter for flag, parameter in SGR_ATTRIBUTES if attr & flag]
+            pair = (attr & curses_constants.A_COLOR) >> 8
+            if pair in self.color_pairs:
+                foreground, background = self.color_pairs[pair]
+                parameters += color_parameters(foreground, 30) + color_parameters(background, 40)
+            sequence = "\x1b[" + ";".join(sorted(set(parameters), key=parameters.index)) + "m"
+            self.sgr_cache[attr] = sequence
+        return sequence
+
+    def encode(self, y, start, end, chars, attrs, output, current_attr):
+        """Appends the escape sequences for cells start to end of a row to output, returns the attribute set last"""
+        output.append("\x1b[{};{}H".format(y + 1, start + 1))
+        for x in range(start, end):
+            if attrs[x] != current_attr:
+                current_attr = attrs[x]
+                output.append(self.sgr(current_attr))
+            output.append(chars[x])
+        return current_attr
+
+    def changes(self):
+        """Returns the escape sequences from the cells sent last time to the current ones, they count as sent then"""
+        output = []
+        current_attr = None
+        for y in sorted(self.dirty_rows):
+            chars, attrs = self.chars[y], self.attrs[y]
+            sent_chars, sent_attrs = self.sent_chars[y], self.sent_attrs[y]
+            changed = [x for x in range(self.cols) if chars[x] != sent_chars[x] or attrs[x] != sent_attrs[x]]
+            if not changed:
+                continue
+            # Like for frames, short unchanged gaps are resent rather than moving the cursor again
+            span_start = span_end = changed[0]
+            for x in changed[1:]:
+                if x - span_end > MAX_UNCHANGED_GAP + 1:
+                    current_attr = self.encode(y, span_start, span_end + 1, chars, attrs, output, current_attr)
+                    span_start = x
+                span_end = x
+            current_attr = self.encode(y, span_start, span_end + 1, chars, attrs, output, current_attr)
+            self.sent_chars[y], self.sent_attrs[y] = list(chars), list(attrs)
+        self.dirty_rows = set()
+        if current_attr:
+            output.append("\x1b[0m")
+        return "".join(output).encode("utf-8")
+
+    def mark_sent(self):
+        """Takes the current cells as sent without encoding them, when there is no client to send them to"""
+        for y in self.dirty_rows:
+            self.sent_chars[y], self.sent_attrs[y] = list(self.chars[y]), list(self.attrs[y])
+        self.dirty_rows = set()
+
+    def snapshot(self):
+        """Returns the escape sequences which paint the cells sent last time onto an empty terminal"""
+        output = [SNAPSHOT_PREFIX]
+        current_attr = 0
+        for y in range(self.rows):
+            chars, attrs = self.sent_chars[y], self.sent_attrs[y]
+            end = self.cols
+            while end > 0 and chars[end - 1] == " " and not attrs[end - 1]:
+                end -= 1
+            if end:
+                current_attr = self.encode(y, 0, end, chars, attrs, output, current_attr)
+        if current_attr:
+            output.append("\x1b[0m")
+        return "".join(output).encode("utf-8")
+
+
+class RenderServer(object):
+    """
+    Sends the ScreenModel to the connected clients from a background thread. The controller only encodes the changes
+    once per screen update, a slow client never blocks it.
+    """
+
+    def __init__(self, address, rows, cols, color_pairs):
+        self.address = address
+        self.screen = ScreenModel(rows, cols, color_pairs)
+        # Guards the sent cells of the screen model and the clients
+        self.lock = threading.Lock()
+        # Client socket -> bytes not sent to it yet
+        self.clients = {}
+        self.wakeup_reader, self.wakeup_writer = os.pipe()
+        os.set_blocking(self.wakeup_reader, False)
+        os.set_blocking(self.wakeup_writer, False)
+        self.listener = open_listener(address)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.listener, selectors.EVENT_READ)
+        self.selector.register(self.wakeup_reader, selectors.EVENT_READ)
+        threading.Thread(target=self._serve_forever, name="RenderServer", daemon=True).start()
+        logger.info("Serving the screen on {}".format(address))
+
+    def publish(self):
+        """Sends what changed in the screen model since the last call to every client, called after a screen update"""
+        with self.lock:
+            if not self.clients:
+                self.screen.mark_sent()
+                return
+            changes = self.screen.changes()
+            if not changes:
+                return
+            snapshot = None
+            for client, pending in self.clients.items():
+                if len(pending) + len(changes) > MAX_PENDING_BYTES:
+                    if snapshot is None:
+                        snapshot = self.screen.snapshot()
+                    pending[:] = snapshot
+                else:
+                    pending += changes
+        self.wake_up()
+
+    def wake_up(self):
+        try:
+            os.write(self.wakeup_writer, b"\0")
+        except BlockingIOError:
+            pass
+
+    def _serve_forever(self):
+        while True:
+            try:
+                events = self.selector.select()
+            except (OSError, ValueError):
+                return
+            for key, mask in events:
+                if key.fileobj is self.listener:
+                    self.accept()
+                elif key.fileobj == self.wakeup_reader:
+                    try:
+                        while os.read(self.wakeup_reader, 4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                elif mask & selectors.EVENT_READ:
+                    self.read_from(key.fileobj)
+            self.send_pending()
+
+    def accept(self):
+        try:
+            client, _ = self.listener.accept()
+        except OSError:
+            return
+        client.setblocking(False)
+        with self.lock:
+            self.clients[client] = bytearray(self.screen.snapshot())
+        self.selector.register(client, selectors.EVENT_READ)
+        logger.info("Render client connected, {} clients".format(len(self.clients)))
+
+    def read_from(self, client):
+        """Clients don't send anything, a readable client socket means it was closed"""
+        try:
+            if client.recv(4096):
+                return
+        except BlockingIOError:
+            return
+        except OSError:
+            pass
+        self.disconnect(client)
+
+    def send_pending(self):
+        """Sends as much as every client takes without blocking"""
+        failed_clients = []
+        with self.lock:
+            for client, pending in self.clients.items():
+                if not pending:
+                    continue
+                try:
+                    del pending[:client.send(pending)]
+                except BlockingIOError:
+                    pass
+                except OSError:
+                    failed_clients.append(client)
+                    continue
+                self.selector.modify(client, selectors.EVENT_READ | (selectors.EVENT_WRITE if pending else 0))
+        for client in failed_clients:
+            self.disconnect(client)
+
+    def disconnect(self, client):
+        with self.lock:
+            if self.clients.pop(client, None) is None:
+                return
+            # Waits for a send_pending() running at the same time, it may still modify the registration
+            self.selector.unregister(client)
+        client.close()
+        logger.info("Render client disconnected, {} clients".format(len(self.clients)))
+
+    def close(self):
+        if self.listener.family == socket.AF_UNIX and os.path.exists(self.address):
+            os.unlink(self.address)
+        self.listener.close()
+        with self.lock:
+            clients, self.clients = list(self.clients), {}
+        for client in clients:
+            client.close()
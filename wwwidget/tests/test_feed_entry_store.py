@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import pickle
+import time
+import unittest
+
+from widgetworkers.feed_entry_store import FeedEntryStore
+
+
+def entry(number, title=None, minute=None):
+    return {"id": "tag:example.com,2024:{}".format(number), "title": title or "Story {}".format(number),
+            "published_parsed": time.struct_time((2024, 1, 1, 10, number if minute is None else minute, 0, 0, 1, 0))}
+
+
+def title_of(feed_entry):
+    return feed_entry["title"]
+
+
+class FeedEntryStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.formatted = []
+        self.store = FeedEntryStore(3, self.format_entry)
+
+    def format_entry(self, feed_entry):
+        self.formatted.append(feed_entry["title"])
+        return feed_entry["title"]
+
+    def test_keeps_newest_entries_newest_first(self):
+        lines = self.store.merge([entry(number) for number in range(10)])
+        self.assertEqual(lines, ["Story 9", "Story 8", "Story 7"])
+
+    def test_unchanged_feed_is_neither_formatted_nor_published(self):
+        feed_entries = [entry(number) for number in range(10)]
+        self.store.merge(feed_entries)
+        formatted = len(self.formatted)
+        self.assertIsNone(self.store.merge(feed_entries))
+        self.assertEqual(len(self.formatted), formatted)
+
+    def test_duplicates_are_shown_once(self):
+        self.assertEqual(self.store.merge([entry(1), entry(2), entry(1)]), ["Story 2", "Story 1"])
+
+    def test_new_and_updated_entries(self):
+        self.store.merge([entry(1), entry(2), entry(3)])
+        self.assertEqual(self.store.merge([entry(1), entry(2), entry(3), entry(4)]), ["Story 4", "Story 3", "Story 2"])
+        self.assertEqual(self.store.merge([entry(1), entry(2), entry(3, "Story 3, updated"), entry(4)]),
+                         ["Story 4", "Story 3, updated", "Story 2"])
+        self.assertEqual(self.store.merge([entry(1), entry(2), entry(3, minute=30), entry(4)]),
+                         ["Story 3", "Story 4", "Story 2"])
+        # Too old to be shown
+        self.assertIsNone(self.store.merge([entry(5, minute=0), entry(1), entry(2), entry(3, minute=30), entry(4)]))
+
+    def test_entries_removed_from_the_feed_are_dropped(self):
+        self.store.merge([entry(number) for number in range(5)])
+        # An older entry takes the place of the removed one
+        self.assertEqual(self.store.merge([entry(0), entry(1), entry(2), entry(4)]), ["Story 4", "Story 2", "Story 1"])
+        self.assertEqual(self.store.merge([]), [])
+
+    def test_survives_pickling(self):
+        store = pickle.loads(pickle.dumps(FeedEntryStore(3, title_of)))
+        self.assertEqual(store.merge([entry(1), entry(2)]), ["Story 2", "Story 1"])
+
+    def test_entries_without_publication_time_are_left_out(self):
+        self.assertEqual(self.store.merge([{"id": "x", "title": "Undated"}, entry(1)]), ["Story 1"])
+
+
+if __name__ == '__main__':
+    unittest.main()
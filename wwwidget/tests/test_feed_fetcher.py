@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+import http.server
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from widgetworkers import feed_fetcher
+from widgetworkers.feed_cache import FeedCache
+
+FEED = b"""<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel><title>Test feed</title>
+<item><guid>tag:example.com,2024:1</guid><title>First story</title><link>http://example.com/1</link>
+<pubDate>Mon, 01 Jan 2024 10:00:00 GMT</pubDate></item>
+<item><guid>tag:example.com,2024:2</guid><title>Second story</title><link>http://example.com/2</link>
+<pubDate>Mon, 01 Jan 2024 11:00:00 GMT</pubDate></item>
+</channel></rss>"""
+ETAG = '"v1"'
+LAST_MODIFIED = "Mon, 01 Jan 2024 11:00:00 GMT"
+
+
+class FeedHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/rss+xml")
+        self.send_header("Content-Length", str(len(FEED)))
+        self.send_header("ETag", ETAG)
+        self.send_header("Last-Modified", LAST_MODIFIED)
+        self.end_headers()
+        self.wfile.write(FEED)
+
+    def log_message(self, *args):
+        pass
+
+
+class FeedFetcherTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FeedHandler)
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.feed_url = "http://127.0.0.1:{}/feed.xml".format(self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.cache_dir)
+
+    def fetch(self, fetcher):
+        state = feed_fetcher.FeedState(self.feed_url, self.cache_dir)
+        return state, fetcher._fetch(state)
+
+    def wait_for_requests(self, count):
+        deadline = time.time() + 5
+        while len(self.server.requests) < count and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(self.server.requests), count)
+
+    def test_not_modified_keeps_entries(self):
+        fetcher = feed_fetcher.FeedFetcher()
+        state, changed = self.fetch(fetcher)
+        self.assertTrue(changed)
+        self.assertEqual([entry["title"] for entry in state.cache.entries], ["First story", "Second story"])
+        self.assertEqual((state.cache.etag, state.cache.modified), (ETAG, LAST_MODIFIED))
+        self.assertNotIn("If-None-Match", self.server.requests[0])
+
+        self.assertFalse(fetcher._fetch(state))
+        self.assertEqual(self.server.requests[1]["If-None-Match"], ETAG)
+        self.assertEqual(self.server.requests[1]["If-Modified-Since"], LAST_MODIFIED)
+        self.assertEqual(len(state.cache.entries), 2)
+
+    def test_restart_from_cache(self):
+        self.fetch(feed_fetcher.FeedFetcher())
+
+        cache = FeedCache(self.feed_url, self.cache_dir)
+        self.assertEqual(cache.etag, ETAG)
+        self.assertEqual([entry["id"] for entry in cache.entries], ["tag:example.com,2024:1", "tag:example.com,2024:2"])
+        self.assertEqual(cache.entries[1]["published_parsed"][:5], (2024, 1, 1, 11, 0))
+
+        # A new fetcher, like after a restart, hands out the cached entries before asking the server
+        fetcher = feed_fetcher.FeedFetcher()
+        received = []
+        fetcher.subscribe(self.feed_url, 3600, received.append, cache_dir=self.cache_dir)
+        try:
+            self.assertEqual([entry["title"] for entry in received[0]], ["First story", "Second story"])
+            self.wait_for_requests(2)
+            self.assertEqual(self.server.requests[1]["If-None-Match"], ETAG)
+            fetcher.executor.shutdown(wait=True)
+            # Not modified, so the subscriber isn't called again
+            self.assertEqual(len(received), 1)
+        finally:
+            fetcher.unsubscribe(self.feed_url, received.append)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from widgetworkers import disk_cache
+from widgetworkers import fortune_cookie_loader as loader_module
+from widgetworkers.fortune_cookie_loader import fortune_cookie_loader
+
+WORDS = ["Moon", "moonlight", "sun", "Sunday", "star", "the", "a", "cat", "honeymoon", "über"]
+SEARCH_WORDS = [None, "Moon", "moon", "un", "über", "the cat", "  ", "nothing"]
+
+
+def line_by_line_cookies(fortune_file, max_width=None, max_height=None, search_word=None):
+    """The cookies the loader picked from before it had an index, reading the whole file line by line"""
+    is_valid = fortune_cookie_loader.is_fortune_cookie_valid
+    found_fortune_cookies = []
+    with open(fortune_file, encoding="utf-8") as file_in:
+        current_fortune_cookie = []
+        for line in file_in:
+            line = line.strip()
+            if line == '%':
+                if is_valid(None, current_fortune_cookie, max_width, max_height, search_word):
+                    found_fortune_cookies.append(current_fortune_cookie)
+                current_fortune_cookie = []
+            else:
+                current_fortune_cookie.append(line)
+    return found_fortune_cookies
+
+
+class FortuneCookieLoaderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.fortune_file = os.path.join(self.cache_dir, "fortunes")
+        random.seed(11)
+        with open(self.fortune_file, "w", encoding="utf-8") as file_out:
+            for _ in range(300):
+                for _ in range(random.randint(1, 8)):
+                    file_out.write(" ".join(random.choice(WORDS) for _ in range(random.randint(0, 9))) + "\n")
+                file_out.write("%\n")
+            file_out.write("a cookie without delimiter is left out\n")
+        loader_module._indices.clear()
+        loader_module._word_indices.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def assert_same_cookies(self):
+        for max_width in (None, 20, 40):
+            for max_height in (None, 3):
+                for search_word in SEARCH_WORDS:
+                    loader = fortune_cookie_loader(self.fortune_file, max_width=max_width, max_height=max_height,
+                                                   search_word=search_word, cache_dir=self.cache_dir)
+                    self.assertEqual([loader.read_fortune_cookie(index) for index in loader.valid_cookies],
+                                     line_by_line_cookies(self.fortune_file, max_width, max_height, search_word),
+                                     (max_width, max_height, search_word))
+
+    def test_same_cookies_as_reading_line_by_line(self):
+        self.assert_same_cookies()
+
+    def test_same_cookies_from_disk_cache(self):
+        fortune_cookie_loader(self.fortune_file, search_word="Moon", cache_dir=self.cache_dir)
+        loader_module._indices.clear()
+        loader_module._word_indices.clear()
+        self.assert_same_cookies()
+
+    def test_words_only_loaded_with_search_word(self):
+        words_path = disk_cache.cache_file(self.cache_dir, "fortune_words", os.path.abspath(self.fortune_file))
+        loader = fortune_cookie_loader(self.fortune_file, max_width=40, cache_dir=self.cache_dir)
+        self.assertIsNone(loader.words)
+        self.assertNotIn("words", loader.index)
+        self.assertFalse(os.path.exists(words_path))
+
+        loader = fortune_cookie_loader(self.fortune_file, search_word="Moon", cache_dir=self.cache_dir)
+        self.assertIn("Moon", loader.words)
+        self.assertTrue(os.path.exists(words_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
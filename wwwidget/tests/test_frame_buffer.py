@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import random
+import unittest
+
+from widgetworkers.frame_buffer import FrameBuffer, CLEAR, ADDSTR
+
+
+def copy_of(frame_buffer):
+    copy = FrameBuffer(frame_buffer.width, frame_buffer.height)
+    copy.apply(frame_buffer.full_frame())
+    return copy
+
+
+def assert_same_content(test_case, frame_buffer, expected):
+    test_case.assertEqual(frame_buffer.rows, expected.rows)
+    test_case.assertEqual(frame_buffer.attrs, expected.attrs)
+    test_case.assertEqual(frame_buffer.background, expected.background)
+
+
+class FrameBufferDiffTestCase(unittest.TestCase):
+    def test_full_frame_round_trip(self):
+        frame_buffer = FrameBuffer(20, 4)
+        frame_buffer.bkgd(" ", 256)
+        frame_buffer.addstr(0, 0, "Hello", 1)
+        frame_buffer.addstr(2, 15, "clipped text", 2)
+        assert_same_content(self, copy_of(frame_buffer), frame_buffer)
+
+    def test_unchanged_buffer_has_empty_diff(self):
+        frame_buffer = FrameBuffer(20, 4)
+        frame_buffer.addstr(1, 2, "same")
+        self.assertEqual(frame_buffer.diff(copy_of(frame_buffer)), [])
+
+    def test_diff_sends_only_changed_spans(self):
+        previous = FrameBuffer(40, 3)
+        previous.addstr(1, 0, "12:00:00 Monday 1 January 2024")
+        frame_buffer = copy_of(previous)
+        frame_buffer.addstr(1, 0, "12:00:01 Monday 1 January 2024")
+        self.assertEqual(frame_buffer.diff(previous), [(ADDSTR, 1, 7, "1", 0)])
+
+    def test_diff_of_other_size_or_background_is_full_frame(self):
+        frame_buffer = FrameBuffer(10, 2)
+        frame_buffer.addstr(0, 0, "text")
+        self.assertEqual(frame_buffer.diff(None)[0], (CLEAR,))
+        self.assertEqual(frame_buffer.diff(FrameBuffer(11, 2))[0], (CLEAR,))
+        previous = copy_of(frame_buffer)
+        frame_buffer.bkgd(".", 0)
+        self.assertEqual(frame_buffer.diff(previous)[0], (CLEAR,))
+
+    def test_tabs_are_expanded_before_clipping(self):
+        frame_buffer = FrameBuffer(30, 10)
+        frame_buffer.addstr(9, 0, "x\tx\tx\tx\tx\tyyyyyyyyyy")
+        self.assertEqual(frame_buffer.rows[9], "x       x       x       x     ")
+        frame_buffer.addstr(0, 3, "a\tb")
+        self.assertEqual(frame_buffer.rows[0].rstrip(), "   a    b")
+        self.assertTrue(all(len(row) == 30 for row in frame_buffer.rows))
+
+    def test_random_diffs_round_trip(self):
+        random.seed(4)
+        width, height = 30, 6
+        shadow = FrameBuffer(width, height)
+        previous = None
+        for _ in range(200):
+            frame_buffer = copy_of(previous) if previous is not None else FrameBuffer(width, height)
+            if random.random() < 0.05:
+                frame_buffer.clear()
+            if random.random() < 0.05:
+                frame_buffer.bkgd(random.choice(" ."), random.choice((0, 256)))
+            for _ in range(random.randint(0, 5)):
+                text = "".join(random.choice("ab ") for _ in range(random.randint(1, 12)))
+                frame_buffer.addstr(random.randrange(height), random.randint(-3, width), text, random.choice((0, 1, 2)))
+            shadow.apply(frame_buffer.diff(previous))
+            assert_same_content(self, shadow, frame_buffer)
+            previous = frame_buffer
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import multiprocessing
+import pickle
+import queue
+import unittest
+
+from widgetworkers import WidgetWorker
+from widgetworkers.frame_buffer import FrameBuffer
+
+FRAMES = 1000
+
+
+class BurstWorker(WidgetWorker.WidgetWorker):
+    """Publishes FRAMES frames as fast as it can, then waits without ever reading its input queue"""
+
+    def __init__(self, output_queue):
+        WidgetWorker.WidgetWorker.__init__(self, output_queue, 0, 0, 22, 3)
+        self.label = "Burst"
+        self.published = multiprocessing.Event()
+        self.finish = multiprocessing.Event()
+
+    def run(self):
+        for number in range(FRAMES):
+            frame = self.new_frame()
+            frame.addstr(0, 0, "frame {}".format(number))
+            self.send_frame(frame)
+        self.published.set()
+        self.finish.wait()
+
+
+class OutputSlotTestCase(unittest.TestCase):
+    def run_burst(self, executor):
+        output_queue = multiprocessing.Queue()
+        worker = BurstWorker(output_queue)
+        worker.executor = executor
+        worker.start()
+        try:
+            self.assertTrue(worker.published.wait(30))
+            shadow = FrameBuffer(*worker.interior_space())
+
+            # Only the first frame is in the queue, all later ones replaced each other in the worker
+            message = output_queue.get(timeout=5)
+            with self.assertRaises(queue.Empty):
+                output_queue.get(timeout=0.2)
+            shadow.apply(pickle.loads(message[2]))
+            self.assertEqual(shadow.rows[0].rstrip(), "frame 0")
+            self.assertEqual(message[5], 0)
+
+            # Taking it lets the newest frame through, though the worker doesn't read its input
+            worker.frame_received()
+            message = output_queue.get(timeout=5)
+            shadow.apply(pickle.loads(message[2]))
+            self.assertEqual(shadow.rows[0].rstrip(), "frame {}".format(FRAMES - 1))
+            self.assertEqual(message[5], FRAMES - 2)
+
+            worker.frame_received()
+            with self.assertRaises(queue.Empty):
+                output_queue.get(timeout=0.2)
+            self.assertEqual(worker.output_slot.value, WidgetWorker.SLOT_FREE)
+        finally:
+            worker.finish.set()
+            if executor == "thread":
+                worker.thread.join(5)
+            else:
+                worker.join(5)
+
+    def test_thread(self):
+        self.run_burst("thread")
+
+    def test_process(self):
+        self.run_burst("process")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import os
+import unittest
+
+from widgetworkers.frame_buffer import FrameBuffer
+from widgetworkers.shared_frame import SharedFrame, SEQUENCE
+
+
+class SharedFrameTestCase(unittest.TestCase):
+    def setUp(self):
+        self.doorbell_reader, self.doorbell_writer = os.pipe()
+        os.set_blocking(self.doorbell_writer, False)
+        self.shared_frame = SharedFrame(12, 3, self.doorbell_writer)
+
+    def tearDown(self):
+        self.shared_frame.close()
+        os.close(self.doorbell_reader)
+        os.close(self.doorbell_writer)
+
+    def publish(self, text, label, previous=None):
+        frame = FrameBuffer(12, 3)
+        frame.addstr(1, 0, text, 1)
+        self.shared_frame.publish(frame, previous, label, 100.0, 0.25)
+        return frame
+
+    def test_round_trip(self):
+        self.publish("hello", "Wörld clock")
+        shadow = FrameBuffer(12, 3)
+        shadow.pop_dirty_rows()
+        label, sent_at, render_seconds, frame_bytes, skipped_frames = self.shared_frame.receive(shadow)
+        self.assertEqual((label, sent_at, render_seconds, skipped_frames), ("Wörld clock", 100.0, 0.25, 0))
+        self.assertEqual(shadow.rows[1], "hello       ")
+        self.assertEqual(shadow.attrs[1][:5], [1] * 5)
+        self.assertEqual(shadow.pop_dirty_rows(), [1])
+        self.assertIsNone(self.shared_frame.receive(shadow))
+
+    def test_frame_being_written_is_not_taken(self):
+        self.publish("hello", "First")
+        SEQUENCE.pack_into(self.shared_frame.shm.buf, 0, self.shared_frame.sequence + 1)
+        self.assertIsNone(self.shared_frame.receive(FrameBuffer(12, 3)))
+
+    def test_overwritten_frames_are_counted(self):
+        previous = self.publish("one", "A")
+        previous = self.publish("two", "B", previous)
+        self.publish("three", "C", previous)
+        shadow = FrameBuffer(12, 3)
+        label, _, _, _, skipped_frames = self.shared_frame.receive(shadow)
+        self.assertEqual((label, skipped_frames, shadow.rows[1]), ("C", 2, "three       "))
+
+
+if __name__ == '__main__':
+    unittest.main()
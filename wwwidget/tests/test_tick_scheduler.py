@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from widgetworkers.tick_scheduler import next_tick, tick_interval_for_time_format
+
+
+class NextTickTestCase(unittest.TestCase):
+    def test_next_full_second(self):
+        self.assertEqual(next_tick(1, 1000.25), 1001)
+
+    def test_next_full_minute(self):
+        self.assertEqual(next_tick(60, 1000.25), 1020)
+
+    def test_on_a_boundary_is_the_following_one(self):
+        self.assertEqual(next_tick(1, 1000), 1001)
+        self.assertEqual(next_tick(60, 1020), 1080)
+
+
+class TickIntervalForTimeFormatTestCase(unittest.TestCase):
+    def test_formats_with_seconds(self):
+        for time_format in ("%H:%M:%S", "%T", "%X", "%c", "%r", "%s", "%H:%M:%S.%f"):
+            self.assertEqual(tick_interval_for_time_format(time_format), 1, time_format)
+
+    def test_formats_without_seconds(self):
+        for time_format in ("%H:%M", "%a %d %b %Y", "%R"):
+            self.assertEqual(tick_interval_for_time_format(time_format), 60, time_format)
+
+    def test_minimum_interval_is_rounded_to_granularity(self):
+        self.assertEqual(tick_interval_for_time_format("%H:%M:%S", minimum_interval=2.5), 3)
+        self.assertEqual(tick_interval_for_time_format("%H:%M", minimum_interval=5), 60)
+        self.assertEqual(tick_interval_for_time_format("%H:%M", minimum_interval=90), 120)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Runtime metrics of every widget, collected by the controller.
+
+They can be shown in an overlay (key "s"), written as JSON to the stats_file on SIGUSR1 and read as JSON from the
+Unix socket stats_socket, both configured in the [wwwidget] section.
+"""
+
+import collections
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Frames/s are counted over this many seconds
+RATE_WINDOW_SECONDS = 10
+# Weight of the newest sample in the moving averages
+AVERAGE_WEIGHT = 0.2
+
+
+def moving_average(average, sample):
+    return sample if average is None else average + AVERAGE_WEIGHT * (sample - average)
+
+
+class WidgetStats(object):
+    def __init__(self):
+        self.frames = 0
+        self.dropped_frames = 0
+        self.total_bytes = 0
+        self.frame_bytes = None
+        self.worker_render_ms = None
+        self.queue_wait_ms = None
+        self.draw_ms = None
+        self.max_queue_wait_ms = 0
+        self.received_at = collections.deque()
+
+    def record_frame(self, frame_bytes, worker_render_seconds, queue_wait_seconds, now):
+        self.frames += 1
+        self.total_bytes += frame_bytes
+        self.frame_bytes = moving_average(self.frame_bytes, frame_bytes)
+        self.worker_render_ms = moving_average(self.worker_render_ms, worker_render_seconds * 1000)
+        self.queue_wait_ms = moving_average(self.queue_wait_ms, queue_wait_seconds * 1000)
+        self.max_queue_wait_ms = max(self.max_queue_wait_ms, queue_wait_seconds * 1000)
+        self.received_at.append(now)
+
+    def record_draw(self, draw_seconds):
+        self.draw_ms = moving_average(self.draw_ms, draw_seconds * 1000)
+
+    def frames_per_second(self, now):
+        while self.received_at and self.received_at[0] < now - RATE_WINDOW_SECONDS:
+            self.received_at.popleft()
+        return len(self.received_at) / RATE_WINDOW_SECONDS
+
+    def as_dict(self, now):
+        return {
+            "frames": self.frames,
+            "frames_per_s": round(self.frames_per_second(now), 2),
+            "dropped_frames": self.dropped_frames,
+            "total_bytes": self.total_bytes,
+            "frame_bytes": round(self.frame_bytes or 0, 1),
+            "worker_render_ms": round(self.worker_render_ms or 0, 3),
+            "queue_wait_ms": round(self.queue_wait_ms or 0, 3),
+            "max_queue_wait_ms": round(self.max_queue_wait_ms, 3),
+            "draw_ms": round(self.draw_ms or 0, 3),
+        }
+
+
+class StatsRegistry(object):
+    """WidgetStats of all widgets, updated by the controller loop and read from other threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.widgets = collections.OrderedDict()
+        self.started_at = time.time()
+        self.server = None
+
+    def get(self, widget_name):
+        """Returns the stats of a widget, the lock has to be held already"""
+        if widget_name not in self.widgets:
+            self.widgets[widget_name] = WidgetStats()
+        return self.widgets[widget_name]
+
+    def record_frame(self, widget_name, frame_bytes, worker_render_seconds, sent_at):
+        now = time.time()
+        with self.lock:
+            self.get(widget_name).record_frame(frame_bytes, worker_render_seconds, now - sent_at, now)
+
+    def record_dropped(self, widget_name, dropped_frames):
+        with self.lock:
+            self.get(widget_name).dropped_frames += dropped_frames
+
+    def record_draw(self, widget_name, draw_seconds):
+        with self.lock:
+            self.get(widget_name).record_draw(draw_seconds)
+
+    def remove(self, widget_name):
+        with self.lock:
+            self.widgets.pop(widget_name, None)
+
+    def snapshot(self):
+        now = time.time()
+        with self.lock:
+            return {
+                "uptime_s": round(now - self.started_at, 1),
+                "widgets": {name: stats.as_dict(now) for name, stats in self.widgets.items()},
+            }
+
+    def dump_json(self, path):
+        try:
+            with open(path, "w") as file_out:
+                json.dump(self.snapshot(), file_out, indent=2)
+            logger.info("Stats written to {}".format(path))
+        except OSError as e:
+            logger.warning("Could not write stats to {}: {}".format(path, e))
+
+    def serve(self, socket_path):
+        """Answers every connection to the Unix socket with a JSON snapshot, from a background thread"""
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(socket_path)
+        self.server.listen(4)
+        threading.Thread(target=self._serve_forever, name="StatsSocket", daemon=True).start()
+        logger.info("Serving stats on {}".format(socket_path))
+
+    def _serve_forever(self):
+        while True:
+            try:
+                connection, _ = self.server.accept()
+            except OSError:
+                return
+            with connection:
+                try:
+                    connection.sendall(json.dumps(self.snapshot()).encode("utf-8") + b"\n")
+                except OSError as e:
+                    logger.debug("Stats client went away: {}".format(e))
+
+    def overlay_lines(self):
+        snapshot = self.snapshot()
+        lines = ["{:<22} {:>6} {:>8} {:>8} {:>7} {:>7} {:>6}".format(
+            "widget", "fps", "render", "queue", "draw", "bytes", "drop")]
+        for name, stats in snapshot["widgets"].items():
+            lines.append("{:<22} {:>6.2f} {:>7.2f}m {:>7.2f}m {:>6.2f}m {:>7.0f} {:>6}".format(
+                name[:22], stats["frames_per_s"], stats["worker_render_ms"], stats["queue_wait_ms"],
+                stats["draw_ms"], stats["frame_bytes"], stats["dropped_frames"]))
+        return lines
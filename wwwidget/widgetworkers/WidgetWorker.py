@@ -1,37 +1,88 @@
 # -*- coding: utf-8 -*-
+import collections
 import multiprocessing
+import threading
 import logging
 import curses
-import pytz
 import datetime
-import pyfiglet
-import feedparser
-import time
 import calendar
+import pickle
+import time
 from . import curses_constants
+from . import disk_cache
+from . import log_pipeline
+from . import tick_scheduler
+from .feed_entry_store import FeedEntryStore
+from .frame_buffer import FrameBuffer
 
-from . import fortune_cookie_loader
+# Dependencies of single widgets (pyfiglet, feedparser, pytz, tzlocal, ...) are imported by the widgets themselves
+# when they are used, so a config only pays for the widgets it contains
 
 logger = logging.getLogger(__name__)
 
+# Widget classes by name, filled in as they are defined
+_widget_classes = {}
+
+# A widget either runs in its own process or as a thread inside the controller process
+EXECUTORS = ("process", "thread")
+# Frames either go through the output queue or are written into a grid in shared memory
+TRANSPORTS = ("queue", "shared_memory")
+
+# Mouse click sent to the widget under the cursor, y and x are relative to the widget's content window
+MouseEvent = collections.namedtuple("MouseEvent", ["y", "x", "bstate"])
+
+# Sent to the widgets of a page that is hidden / shown again, a suspended widget stops fetching and rendering
+SUSPEND = "suspend"
+RESUME = "resume"
+# Sent to a widget whose config section was removed or changed, it stops for good
+STOP = "stop"
+
+# Output slot of a widget using the queue transport: no frame in the queue, one frame in the queue, one frame in the
+# queue and a newer one waiting in the widget
+SLOT_FREE, SLOT_SENT, SLOT_PENDING = 0, 1, 2
+
+
+def get_executor(config_section, widget_class):
+    """The executor of a section, defined in the section itself, globally in [wwwidget] or by the widget class"""
+    executor = config_section.get("executor", config_section.parser.get("wwwidget", "executor", fallback=None))
+    if executor is None:
+        return widget_class.default_executor
+    if executor not in EXECUTORS:
+        logger.warning("Unknown executor {} in config section {}, using {}".format(
+            executor, config_section.name, widget_class.default_executor))
+        return widget_class.default_executor
+    return executor
+
+
+def get_transport(config_section):
+    """The frame transport of a section, defined in the section itself, globally in [wwwidget] or the queue"""
+    transport = config_section.get("transport", config_section.parser.get("wwwidget", "transport", fallback="queue"))
+    if transport not in TRANSPORTS:
+        logger.warning("Unknown transport {} in config section {}, using the queue".format(
+            transport, config_section.name))
+        return "queue"
+    return transport
+
+
+def find_widget_class(section_name):
+    """Returns the widget class whose name the section name starts with, or None"""
+    return next((widget_class for widget_class_name, widget_class in _widget_classes.items()
+                 if section_name.startswith(widget_class_name)), None)
+
 
 def is_config_section_valid_widget_worker(config_section):
-    subclasses_dict = {subclass.__name__: subclass for subclass in WidgetWorker.get_all_subclasses()}
-    subclass_names = subclasses_dict.keys()
-    return any(config_section.name.startswith(subclass_name) for subclass_name in subclass_names)
+    return find_widget_class(config_section.name) is not None
 
 
 def instantiate_widget_from_configsection(config_section, output_queue):
     logger.info("Initializing widget based on config section {}...".format(config_section.name))
-    subclasses_dict = {subclass.__name__: subclass for subclass in WidgetWorker.get_all_subclasses()}
-    subclass_names = subclasses_dict.keys()
-    matching_subclass_name = next(
-        (subclass_name for subclass_name in subclass_names if config_section.name.startswith(subclass_name)), None)
-    matching_subclass = subclasses_dict[matching_subclass_name]
+    matching_subclass = find_widget_class(config_section.name)
     logger.info("Found matching widget class {}...".format(matching_subclass))
     if matching_subclass:
         try:
             widget_instance = matching_subclass.InstanceFromConfigSection(config_section, output_queue)
+            widget_instance.executor = get_executor(config_section, matching_subclass)
+            widget_instance.transport = get_transport(config_section)
         except Exception as e:
             logger.error("Instantation of config_section {} failed, error message:".format(config_section))
             logger.error(e)
@@ -42,23 +93,191 @@ def instantiate_widget_from_configsection(config_section, output_queue):
 
 
 class WidgetWorker(multiprocessing.Process):
+    # Widgets which block or need a lot of CPU get their own process, lightweight ones can run as a thread
+    default_executor = "process"
+
     def __init__(self, output_queue, x, y, width, height):
         multiprocessing.Process.__init__(self)
+        self.executor = self.default_executor
+        self.thread = None
+        self.transport = "queue"
+        self.shared_frame = None
         self.output_queue = output_queue
+        # At most one frame per widget is in the output queue, so a fast widget can neither fill it nor delay the
+        # frames of others. Frames published before the controller took it replace each other in pending_frame.
+        self.output_slot = multiprocessing.Value("i", SLOT_FREE)
+        self.pending_frame = None
+        self.replaced_frames = 0
+        # Released by the controller when it took a frame while a newer one was pending. The flusher thread of the
+        # widget sends that one then, whatever the widget itself is doing. Releasing never blocks the controller.
+        self.slot_freed = multiprocessing.Semaphore(0)
+        self.flusher = None
+        self.stopping = False
         self.width = width
         self.height = height
         self.x = x
         self.y = y
+        # Last frame that was sent to the controller, following frames are sent as difference to it
+        self.last_frame = None
+        # Input from the controller, e.g. mouse clicks
+        self.input_queue = multiprocessing.JoinableQueue()
+        # Widgets on hidden pages are suspended, the controller sets this before start() and sends SUSPEND/RESUME after
+        self.suspended = False
+        # Frames can be sent from several threads, e.g. by the feed fetcher
+        self.output_lock = threading.Lock()
+
+    def __getstate__(self):
+        # A process widget is pickled when it is started with spawn or forkserver, locks and threads can't be
+        state = self.__dict__.copy()
+        del state["output_lock"]
+        state["thread"] = None
+        state["flusher"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.output_lock = threading.Lock()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _widget_classes[cls.__name__] = cls
+
+    def start(self):
+        """Starts run() either in a new process or in a thread of the current process"""
+        logger.info("Starting {} as {}".format(self.name, self.executor))
+        if self.executor == "thread":
+            self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+            self.thread.start()
+        else:
+            multiprocessing.Process.start(self)
+
+    def stop(self):
+        """Asks the widget to stop, it ends once it handled the input it got before"""
+        self.send_input(STOP)
+
+    def is_running(self):
+        if self.executor == "thread":
+            return self.thread is not None and self.thread.is_alive()
+        return self.is_alive()
 
     def get_windows(self):
         border_win = curses.newwin(self.height, self.width, self.y, self.x)
         win = border_win.derwin(self.height - 2, self.width - 2, 1, 1)
         return border_win, win
 
+    def attach_shared_frame(self, doorbell):
+        """Switches to the shared memory transport, has to be called by the controller before start()"""
+        from .shared_frame import SharedFrame
+        self.shared_frame = SharedFrame(*self.interior_space(), doorbell=doorbell)
+        return self.shared_frame
+
+    def new_frame(self):
+        """Returns an empty frame to draw into with addstr(), writes outside of the widget are clipped right away"""
+        return FrameBuffer(*self.interior_space())
+
     def send_output_to_queue(self, output):
-        self.output_queue.put((self.name, self.label, output))
+        """Sends a frame given as list of operations, e.g. [["addstr", y, x, text, attr]]"""
+        frame = self.new_frame()
+        frame.apply(output)
+        self.send_frame(frame)
+
+    def send_frame(self, frame):
+        """Sends what changed since the last frame to the controller, never blocks"""
+        render_seconds = time.perf_counter() - frame.created_at
+        with self.output_lock:
+            if self.shared_frame is not None:
+                previous = self.last_frame
+                if previous is None or (frame.rows, frame.attrs, frame.background) != \
+                        (previous.rows, previous.attrs, previous.background):
+                    self.shared_frame.publish(frame, previous, self.label, time.time(), render_seconds)
+                self.last_frame = frame
+                return
+            with self.output_slot.get_lock():
+                if self.output_slot.value != SLOT_FREE:
+                    # The controller didn't take the last frame yet, this one waits and replaces any older waiting one
+                    if self.pending_frame is not None:
+                        self.replaced_frames += 1
+                    self.pending_frame = (frame, render_seconds)
+                    self.output_slot.value = SLOT_PENDING
+                    if self.flusher is None:
+                        self.flusher = threading.Thread(target=self.flush_pending_frames, name=self.name + "-flusher",
+                                                        daemon=True)
+                        self.flusher.start()
+                    return
+            if self.pending_frame is not None:
+                self.replaced_frames += 1
+                self.pending_frame = None
+            self.put_frame(frame, render_seconds)
+
+    def put_frame(self, frame, render_seconds):
+        """Puts the difference to the last sent frame into the output queue, the output slot has to be free"""
+        changes = frame.diff(self.last_frame)
+        self.last_frame = frame
+        if changes:
+            # Pickled here instead of by the queue, so the controller knows the frame size without pickling again
+            payload = pickle.dumps(changes, pickle.HIGHEST_PROTOCOL)
+            # Taken before the frame is in the queue, the controller frees the slot as soon as it got the frame
+            self.output_slot.value = SLOT_SENT
+            self.output_queue.put((self.name, self.label, payload, time.time(), render_seconds, self.replaced_frames))
+            self.replaced_frames = 0
+
+    def frame_received(self):
+        """Called by the controller for every frame of this widget it took from the output queue"""
+        with self.output_slot.get_lock():
+            pending = self.output_slot.value == SLOT_PENDING
+            self.output_slot.value = SLOT_FREE
+        if pending:
+            self.slot_freed.release()
+
+    def flush_pending_frames(self):
+        """Runs in the flusher thread of the widget, which is started with the first frame that has to wait"""
+        while True:
+            self.slot_freed.acquire()
+            if self.stopping:
+                return
+            self.flush_pending_frame()
+
+    def flush_pending_frame(self):
+        """Sends the frame waiting for the output slot, if the slot is still free"""
+        with self.output_lock:
+            if self.pending_frame is None or self.output_slot.value != SLOT_FREE:
+                return
+            frame, render_seconds = self.pending_frame
+            self.pending_frame = None
+            self.put_frame(frame, render_seconds)
 
     def send_input(self, input):
+        self.input_queue.put(input)
+
+    def handle_input(self, event):
+        """Handles SUSPEND, RESUME and STOP from the input queue, returns True if the event was one of them"""
+        if event == STOP:
+            if not self.suspended:
+                self.suspended = True
+                self.on_suspend()
+            # A thread widget's flusher would wait forever, a process widget's ends with the process
+            self.stopping = True
+            self.slot_freed.release()
+            # Ends run() in a thread as well as in a process, "except Exception" in run() doesn't catch it
+            raise SystemExit
+        if event == SUSPEND:
+            if not self.suspended:
+                self.suspended = True
+                self.on_suspend()
+            return True
+        if event == RESUME:
+            if self.suspended:
+                self.suspended = False
+                self.on_resume()
+            return True
+        return False
+
+    def on_suspend(self):
+        """Stops everything the widget does periodically"""
+        pass
+
+    def on_resume(self):
+        """Starts the periodic work again, the controller shows the last frame until a new one arrives"""
         pass
 
     @classmethod
@@ -79,13 +298,16 @@ class WidgetWorker(multiprocessing.Process):
 
 
 class FortuneWorker(WidgetWorker):
+    default_executor = "thread"
 
-    def __init__(self, output_queue, x, y, width, height, fortune_file, label="Bern"):
+    def __init__(self, output_queue, x, y, width, height, fortune_file, label="Bern",
+                 cache_dir=disk_cache.DEFAULT_CACHE_DIR):
         WidgetWorker.__init__(self, output_queue, x, y, width, height)
         self.output_queue = output_queue
         self.fortune_file = fortune_file
         self.label = label
-        self.input_queue = multiprocessing.JoinableQueue()
+        self.cache_dir = cache_dir
+        self.loader = None
 
     @classmethod
     def InstanceFromConfigSection(cls, configsection, output_queue):
@@ -97,36 +319,42 @@ class FortuneWorker(WidgetWorker):
             height=configsection.getint("height"),
             fortune_file=configsection.get("fortune_file"),
             label=configsection.get("label"),
+            cache_dir=disk_cache.get_cache_dir(configsection),
         )
         return instance
 
     def run(self):
+        from . import fortune_cookie_loader
         max_width, max_height = self.interior_space()
-        f = fortune_cookie_loader.fortune_cookie_loader(self.fortune_file, max_width=max_width, max_height=max_height)
-        self.send_new_cookie(f)
+        self.loader = fortune_cookie_loader.fortune_cookie_loader(self.fortune_file, max_width=max_width,
+                                                                  max_height=max_height, cache_dir=self.cache_dir)
+        # A widget on a hidden page gets its first cookie when its page is shown
+        if not self.suspended:
+            self.send_new_cookie()
         while True:
             event = self.input_queue.get()
-            self.send_new_cookie(f)
-
-    def send_input(self, input):
-        self.input_queue.put(input)
-
-    def send_new_cookie(self, f):
-        cookie = f.return_fortune_cookie()
-        logger.info(cookie)
-        output = []
-        regular_text = True
+            if self.handle_input(event):
+                continue
+            if isinstance(event, MouseEvent):
+                self.send_new_cookie()
+
+    def on_resume(self):
+        # The cookie shown before the page was hidden stays
+        if self.last_frame is None:
+            self.send_new_cookie()
+
+    def send_new_cookie(self):
+        cookie = self.loader.return_fortune_cookie()
+        if log_pipeline.should_log_frame(self.name, "cookie"):
+            logger.debug(cookie)
+        frame = self.new_frame()
+        attr = 0
         for y, line in enumerate(cookie):
-            output_line = ["addstr", y, 0, line]
+            # Everything from the author line on is dimmed
             if line.startswith("--"):
-                regular_text = False
-
-            if not regular_text:
-                output_line.append(curses_constants.A_DIM)
-
-            output.append(output_line)
-        logger.info(output)
-        self.send_output_to_queue(output)
+                attr = curses_constants.A_DIM
+            frame.addstr(y, 0, line, attr)
+        self.send_frame(frame)
 
     def get_label(self):
         return self.label
@@ -135,12 +363,23 @@ class FortuneWorker(WidgetWorker):
 
 class FeedReaderWorker(WidgetWorker):
     # http://rss.cnn.com/rss/cnn_topstories.rss
+    # The network I/O happens in the shared feed fetcher, so feed readers in threads share one fetcher
+    default_executor = "thread"
 
-    def __init__(self, output_queue, x, y, width, height, feed_url, refresh_interval_mins = 10, label = "RSS Feed"):
+    def __init__(self, output_queue, x, y, width, height, feed_url, refresh_interval_mins = 10, label = "RSS Feed",
+                 cache_dir = disk_cache.DEFAULT_CACHE_DIR, fetch_timeout = None, max_concurrent_fetches = None):
         WidgetWorker.__init__(self, output_queue, x, y, width, height)
         self.feed_url = feed_url
         self.refresh_interval_mins = refresh_interval_mins
         self.label = label
+        self.cache_dir = cache_dir
+        # None for the defaults of the feed fetcher, which isn't imported before the widget runs
+        self.fetch_timeout = fetch_timeout
+        self.max_concurrent_fetches = max_concurrent_fetches
+        # Looked up on the first refresh, not for every entry
+        self.local_timezone = None
+        # The entries that fit into the widget, each one is formatted only once
+        self.entry_store = FeedEntryStore(self.interior_space()[1], self._prep_entry_summary)
 
     @classmethod
     def InstanceFromConfigSection(cls, configsection, output_queue):
@@ -153,6 +392,10 @@ class FeedReaderWorker(WidgetWorker):
             feed_url=configsection.get("feed_url"),
             refresh_interval_mins=configsection.getint("refresh_interval_mins"),
             label=configsection.get("label"),
+            cache_dir=disk_cache.get_cache_dir(configsection),
+            fetch_timeout=configsection.getint("fetch_timeout", configsection.parser.getint(
+                "wwwidget", "fetch_timeout", fallback=None)),
+            max_concurrent_fetches=configsection.parser.getint("wwwidget", "max_concurrent_fetches", fallback=None),
         )
         return instance
 
@@ -160,41 +403,51 @@ class FeedReaderWorker(WidgetWorker):
         if hasattr(entry, "published_parsed"):
             utc_tuple = entry.published_parsed
             posix_timestamp = calendar.timegm(utc_tuple)
-            from tzlocal import get_localzone
-            local_timezone = get_localzone()
-            local_time = datetime.datetime.fromtimestamp(posix_timestamp, local_timezone)
-            local_time.strftime("%m/%d/%Y, %H:%M:%S")
+            if self.local_timezone is None:
+                from tzlocal import get_localzone
+                self.local_timezone = get_localzone()
+            local_time = datetime.datetime.fromtimestamp(posix_timestamp, self.local_timezone)
             summary = "{}: {}".format(local_time.strftime("%Y-%m-%d %H:%M"), entry["title"])
         else:
             summary = "No Time: {}".format(entry["title"])
         return summary
 
-    def run(self):
-        while True:
-            feed = feedparser.parse(self.feed_url)
-            feed_entries_without_pubdate = [entry for entry in feed["entries"] if hasattr(entry,"published_parsed")]
-            feed_entries_without_pubdate.sort(key=lambda x: x.published_parsed, reverse=True)
+    def send_entries(self, feed_entries):
+        entries = self.entry_store.merge(feed_entries)
+        if entries is None:
+            # Nothing new among the entries the widget shows
+            return
+
+        frame = self.new_frame()
 
-            entries = []
-            for entry in feed_entries_without_pubdate[:self.y - 2]:
-                if hasattr(entry, "published_parsed"):
-                    entries.append(self._prep_entry_summary(entry))
+        for y, line in enumerate(entries):
+            if y%2:
+                #attr = curses.color_pair(9)
+                attr = curses_constants.A_REVERSE
+            else:
+                #attr = curses.color_pair(8)
+                attr = curses_constants.A_BOLD
+            frame.addstr(y, 0, line, attr)
 
-            output = []
+        self.send_frame(frame)
 
-            for y, line in enumerate(entries):
-                output_line = ["addstr", y, 0, line]
-                if y%2:
-                    #output_line.append(curses.color_pair(9))
-                    output_line.append(curses_constants.A_REVERSE)
-                else:
-                    #output_line.append(curses.color_pair(8))
-                    output_line.append(curses_constants.A_BOLD)
-                output.append(output_line)
+    def run(self):
+        if not self.suspended:
+            self.on_resume()
+        while True:
+            self.handle_input(self.input_queue.get())
 
-            self.send_output_to_queue(output)
+    def on_resume(self):
+        # The fetcher sends the cached entries right away and new ones whenever the feed changed
+        from . import feed_fetcher
+        fetcher = feed_fetcher.get_fetcher(self.max_concurrent_fetches or feed_fetcher.DEFAULT_MAX_CONCURRENT_FETCHES)
+        fetcher.subscribe(self.feed_url, self.refresh_interval_mins * 60, self.send_entries, cache_dir=self.cache_dir,
+                          timeout=self.fetch_timeout or feed_fetcher.DEFAULT_FETCH_TIMEOUT)
 
-            time.sleep(self.refresh_interval_mins * 60)
+    def on_suspend(self):
+        # The feed isn't fetched anymore once no widget in this process shows it
+        from . import feed_fetcher
+        feed_fetcher.get_fetcher().unsubscribe(self.feed_url, self.send_entries)
 
 """
 class QuoteWorker(WidgetWorker):
@@ -284,8 +537,11 @@ class CounterWorker(WidgetWorker):
 """
 
 class WorldClockWorker(WidgetWorker):
+    default_executor = "thread"
+
     def __init__(self, output_queue, x, y, width, height, destination_timezone='Europe/Zurich', label="Bern",
                  sleep_time=1.0, time_format='%H:%M:%S', font='nancyj'):
+        import pytz
         WidgetWorker.__init__(self, output_queue, x, y, width, height)
         self.label = label
         self.local_timezone = pytz.timezone('US/Central')
@@ -293,6 +549,7 @@ class WorldClockWorker(WidgetWorker):
         self.sleep_time = sleep_time
         self.time_format = time_format
         self.font = font
+        self.tick_subscription = None
 
     @classmethod
     def InstanceFromConfigSection(cls, configsection, output_queue):
@@ -311,32 +568,50 @@ class WorldClockWorker(WidgetWorker):
         return instance
 
     def generate_figlet_output(self, string_to_output):
-        output_lines = pyfiglet.figlet_format(string_to_output, font=self.font, width=self.width - 2).split('\n')
+        from . import figlet_glyphs
+        output_lines = figlet_glyphs.get_glyph_cache(self.font, self.width - 2).render(string_to_output)
         return [output_line for output_line in output_lines if output_line.strip()]
 
     def get_label(self):
         return self.label
 
+    def tick_interval(self):
+        return tick_scheduler.tick_interval_for_time_format(self.time_format, self.sleep_time)
+
+    def send_time(self):
+        now = datetime.datetime.now()
+        local_time = self.local_timezone.localize(now)
+        destination_time = local_time.astimezone(self.destination_timezone)
+        formatted_destination_time = destination_time.strftime(self.time_format)
+        figlet_lines = self.generate_figlet_output(formatted_destination_time)
+        frame = self.new_frame()
+
+        for y, line in enumerate(figlet_lines):
+            # if line.startswith("--"):
+            #     attr = curses.color_pair(9)
+            # else:
+            #     attr = curses.color_pair(8)
+            frame.addstr(y, 0, line)
+
+        self.send_frame(frame)
+
     def run(self):
         try:
+            # Prerender the glyphs before the first tick
+            from . import figlet_glyphs
+            figlet_glyphs.get_glyph_cache(self.font, self.width - 2)
+            if not self.suspended:
+                self.on_resume()
             while True:
-                now = datetime.datetime.now()
-                local_time = self.local_timezone.localize(now)
-                destination_time = local_time.astimezone(self.destination_timezone)
-                formatted_destination_time = destination_time.strftime(self.time_format)
-                figlet_lines = self.generate_figlet_output(formatted_destination_time)
-                output_lines = []
-
-                for y, line in enumerate(figlet_lines):
-                    output_line = ["addstr", y, 0, line]
-                    # if line.startswith("--"):
-                    #     output_line.append(curses.color_pair(9))
-                    # else:
-                    #     output_line.append(curses.color_pair(8))
-                    output_lines.append(output_line)
-
-                self.send_output_to_queue(output_lines)
-                time.sleep(self.sleep_time)
+                self.handle_input(self.input_queue.get())
         except Exception as e:
             logger.error(e)
 
+    def on_resume(self):
+        self.send_time()
+        # Wake up exactly when the displayed time changes, together with all other clocks
+        self.tick_subscription = tick_scheduler.get_scheduler().schedule(self.tick_interval(), self.send_time)
+
+    def on_suspend(self):
+        tick_scheduler.get_scheduler().cancel(self.tick_subscription)
+        self.tick_subscription = None
@@ -5,6 +5,7 @@ A_REVERSE = 262144
 A_STANDOUT = 65536
 A_DIM = 1048576
 A_UNDERLINE = 131072
+A_COLOR = 65280
 
 class CursesConstantsTestCase(unittest.TestCase):
     def setUp(self):
@@ -28,6 +29,9 @@ class CursesConstantsTestCase(unittest.TestCase):
     def test_A_UNDERLINE(self):
         self.assertEqual(A_UNDERLINE, curses.A_UNDERLINE)
 
+    def test_A_COLOR(self):
+        self.assertEqual(A_COLOR, curses.A_COLOR)
+
 
 if __name__ == '__main__':
     import curses
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "wwwidget")
+
+
+def get_cache_dir(config_section):
+    """The cache directory of a section, defined in the section itself, globally in [wwwidget] or the default one"""
+    return config_section.get("cache_dir", config_section.parser.get("wwwidget", "cache_dir",
+                                                                     fallback=DEFAULT_CACHE_DIR))
+
+
+def cache_file(cache_dir, namespace, key):
+    """Returns the path of the cache file for key, e.g. a feed URL, without creating it"""
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, namespace, digest + ".json")
+
+
+def load_json(path):
+    """Returns the content of a cache file, or None if it doesn't exist or can't be read"""
+    try:
+        with open(path, encoding="utf-8") as file_in:
+            return json.load(file_in)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable cache file {}: {}".format(path, e))
+        return None
+
+
+def store_json(path, data):
+    """Writes a cache file atomically, so a crash or power loss never leaves half a file behind"""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Unique per writer, several threads and processes may store the same file at once
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=os.path.dirname(path), suffix=".tmp",
+                                         delete=False) as file_out:
+            json.dump(data, file_out)
+        os.replace(file_out.name, path)
+    except OSError as e:
+        logger.warning("Could not write cache file {}: {}".format(path, e))
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import logging
+import time
+
+import feedparser
+
+from . import disk_cache
+
+logger = logging.getLogger(__name__)
+
+# Only these fields of an entry are needed to render it, and only they are written to disk
+CACHED_ENTRY_FIELDS = ("id", "link", "title")
+
+
+class FeedCache(object):
+    """
+    ETag, Last-Modified and the last parsed entries of one feed, persisted to disk.
+
+    They are used by the FeedFetcher to send conditional requests, so an unchanged feed is neither downloaded nor
+    parsed again, and to show the last known entries right after a restart.
+    """
+
+    def __init__(self, feed_url, cache_dir=disk_cache.DEFAULT_CACHE_DIR):
+        self.feed_url = feed_url
+        self.path = disk_cache.cache_file(cache_dir, "feeds", feed_url)
+        data = disk_cache.load_json(self.path) or {}
+        self.etag = data.get("etag")
+        self.modified = data.get("modified")
+        self.entries = [self._entry_from_json(entry) for entry in data.get("entries", [])]
+
+    def update(self, feed):
+        self.etag = feed.get("etag")
+        self.modified = feed.get("modified")
+        self.entries = [self._entry_from_json(self._entry_to_json(entry)) for entry in feed["entries"]]
+        disk_cache.store_json(self.path, {
+            "feed_url": self.feed_url,
+            "etag": self.etag,
+            "modified": self.modified,
+            "entries": [self._entry_to_json(entry) for entry in self.entries],
+        })
+
+    @staticmethod
+    def _entry_to_json(entry):
+        data = {field: entry.get(field) for field in CACHED_ENTRY_FIELDS}
+        if entry.get("published_parsed"):
+            data["published_parsed"] = list(entry["published_parsed"])
+        return data
+
+    @staticmethod
+    def _entry_from_json(data):
+        entry = feedparser.FeedParserDict({field: data.get(field) for field in CACHED_ENTRY_FIELDS})
+        if data.get("published_parsed"):
+            entry["published_parsed"] = time.struct_time(data["published_parsed"])
+        return entry
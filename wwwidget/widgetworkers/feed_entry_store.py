@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import bisect
+import calendar
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def entry_id(entry):
+    """Identifies an entry across refreshes, by its id, link or title, whatever the feed has"""
+    return str(entry.get("id") or entry.get("link") or entry.get("title"))
+
+
+class FeedEntryStore(object):
+    """
+    The newest entries of one feed, without duplicates and ordered by their publication time, with their formatted
+    summary lines.
+
+    Only as many entries are kept as the widget shows, an older entry couldn't become visible anyway. Entries already
+    in the store or older than all of them cost a dict lookup on every refresh, a new one is formatted once and
+    inserted at its place found by bisection. Entries without publication time are left out, entries no longer in
+    the feed are removed.
+    """
+
+    def __init__(self, max_entries, format_entry):
+        self.max_entries = max(max_entries, 0)
+        self.format_entry = format_entry
+        # Sort keys (newest first) and summary lines in the same order
+        self.keys = []
+        self.lines = []
+        # Entry id -> (sort key, title) of the entries in the store
+        self.entries = {}
+        # Subscribers of a feed may be called from the fetcher's threads and the widget's own thread
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # Pickled with a feed reader running as process under spawn or forkserver
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def merge(self, feed_entries):
+        """
+        Takes all current entries of the feed, adds new and updated ones and removes those the feed doesn't have
+        anymore. Returns the summary lines if they changed and None otherwise.
+        """
+        with self.lock:
+            feed_ids = set(entry_id(entry) for entry in feed_entries if entry.get("published_parsed"))
+            removed_keys = [key for key_id, (key, title) in self.entries.items() if key_id not in feed_ids]
+            for key in removed_keys:
+                self._remove(key)
+            changed = bool(removed_keys)
+            for entry in feed_entries:
+                if not entry.get("published_parsed"):
+                    continue
+                key_id = entry_id(entry)
+                key = (-calendar.timegm(entry["published_parsed"]), key_id)
+                known = self.entries.get(key_id)
+                if known == (key, entry.get("title")):
+                    continue
+                if known is None and len(self.keys) >= self.max_entries and \
+                        (not self.keys or key > self.keys[-1]):
+                    continue
+                if known is not None:
+                    self._remove(known[0])
+                index = bisect.bisect_left(self.keys, key)
+                self.keys.insert(index, key)
+                self.lines.insert(index, self.format_entry(entry))
+                self.entries[key_id] = (key, entry.get("title"))
+                while len(self.keys) > self.max_entries:
+                    self._remove(self.keys[-1])
+                changed = True
+            return list(self.lines) if changed else None
+
+    def _remove(self, key):
+        index = bisect.bisect_left(self.keys, key)
+        del self.keys[index]
+        del self.lines[index]
+        del self.entries[key[1]]
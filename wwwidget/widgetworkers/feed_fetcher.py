@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+import concurrent.futures
+import gzip
+import http.client
+import logging
+import os
+import threading
+import urllib.parse
+
+import feedparser
+
+from . import disk_cache
+from . import feed_cache
+from . import tick_scheduler
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENT_FETCHES = 4
+DEFAULT_FETCH_TIMEOUT = 10
+MAX_REDIRECTS = 5
+USER_AGENT = "wwwidget feed reader"
+
+_fetcher = None
+_fetcher_pid = None
+
+
+def get_fetcher(max_concurrent_fetches=DEFAULT_MAX_CONCURRENT_FETCHES):
+    """Returns the fetcher shared by all feed readers running in the current process"""
+    global _fetcher, _fetcher_pid
+    if _fetcher is None or _fetcher_pid != os.getpid():
+        _fetcher = FeedFetcher(max_concurrent_fetches)
+        _fetcher_pid = os.getpid()
+    return _fetcher
+
+
+class FetchError(Exception):
+    pass
+
+
+class ConnectionPool(object):
+    """Keeps idle HTTP connections per host open, so refreshing a feed doesn't need a new TCP and TLS handshake"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.idle_connections = {}
+
+    def get(self, scheme, netloc, timeout):
+        with self.lock:
+            idle = self.idle_connections.get((scheme, netloc))
+            if idle:
+                connection = idle.pop()
+                connection.timeout = timeout
+                if connection.sock is not None:
+                    connection.sock.settimeout(timeout)
+                return connection, True
+        connection_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return connection_class(netloc, timeout=timeout), False
+
+    def put(self, scheme, netloc, connection):
+        with self.lock:
+            self.idle_connections.setdefault((scheme, netloc), []).append(connection)
+
+
+class FeedState(object):
+    def __init__(self, feed_url, cache_dir):
+        self.feed_url = feed_url
+        self.cache = feed_cache.FeedCache(feed_url, cache_dir)
+        self.subscribers = []
+        self.in_flight = False
+        self.tick_subscription = None
+        self.refresh_interval = None
+        self.timeout = DEFAULT_FETCH_TIMEOUT
+
+
+class FeedFetcher(object):
+    """
+    Fetches the feeds of all feed readers in a process concurrently, with a limited number of threads, keep-alive
+    connections and a timeout per request.
+
+    Subscribers are called with the entries of their feed whenever they changed. They get the last good entries right
+    away when they subscribe, and keep them while a refresh is in flight or failed.
+    """
+
+    def __init__(self, max_concurrent_fetches=DEFAULT_MAX_CONCURRENT_FETCHES):
+        self.lock = threading.Lock()
+        self.feeds = {}
+        self.connections = ConnectionPool()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrent_fetches,
+                                                              thread_name_prefix="FeedFetcher")
+
+    def subscribe(self, feed_url, refresh_interval, callback, cache_dir=disk_cache.DEFAULT_CACHE_DIR,
+                  timeout=DEFAULT_FETCH_TIMEOUT):
+        with self.lock:
+            state = self.feeds.get(feed_url)
+            new_feed = state is None
+            if new_feed:
+                state = FeedState(feed_url, cache_dir)
+                state.timeout = timeout
+                self.feeds[feed_url] = state
+            state.subscribers.append(callback)
+            state.timeout = min(state.timeout, timeout)
+            # The feed is refreshed as often as its most impatient subscriber wants
+            if state.refresh_interval is None or refresh_interval < state.refresh_interval:
+                if state.tick_subscription is not None:
+                    tick_scheduler.get_scheduler().cancel(state.tick_subscription)
+                state.refresh_interval = refresh_interval
+                state.tick_subscription = tick_scheduler.get_scheduler().schedule(
+                    refresh_interval, lambda: self.refresh(feed_url))
+            entries = state.cache.entries
+
+        if entries:
+            callback(entries)
+        if new_feed:
+            self.refresh(feed_url)
+
+    def unsubscribe(self, feed_url, callback):
+        with self.lock:
+            state = self.feeds.get(feed_url)
+            if state is None or callback not in state.subscribers:
+                return
+            state.subscribers.remove(callback)
+            if not state.subscribers:
+                tick_scheduler.get_scheduler().cancel(state.tick_subscription)
+                del self.feeds[feed_url]
+
+    def refresh(self, feed_url):
+        """Starts fetching a feed in the background, unless it is already being fetched"""
+        with self.lock:
+            state = self.feeds.get(feed_url)
+            if state is None or state.in_flight:
+                return
+            state.in_flight = True
+        self.executor.submit(self._refresh, state)
+
+    def _refresh(self, state):
+        try:
+            changed = self._fetch(state)
+        except Exception as e:
+            logger.warning("Fetching feed {} failed, keeping the last entries: {}".format(state.feed_url, e))
+            changed = False
+        finally:
+            with self.lock:
+                state.in_flight = False
+
+        if changed:
+            with self.lock:
+                subscribers = list(state.subscribers)
+                entries = state.cache.entries
+            for callback in subscribers:
+                try:
+                    callback(entries)
+                except Exception as e:
+                    logger.error("Feed subscriber {} failed: {}".format(callback, e))
+
+    def _fetch(self, state):
+        """Fetches and parses a feed, returns False if it didn't change"""
+        url = state.feed_url
+        if urllib.parse.urlsplit(url).scheme not in ("http", "https"):
+            # Local files and everything else feedparser can read by itself
+            feed = feedparser.parse(url)
+            if feed.get("bozo") and not feed["entries"]:
+                raise FetchError(feed.get("bozo_exception"))
+            state.cache.update(feed)
+            return True
+
+        headers = {"User-Agent": USER_AGENT, "Accept-Encoding": "gzip"}
+        if state.cache.etag:
+            headers["If-None-Match"] = state.cache.etag
+        if state.cache.modified:
+            headers["If-Modified-Since"] = state.cache.modified
+
+        for _ in range(MAX_REDIRECTS):
+            status, response_headers, body = self._request(url, headers, state.timeout)
+            if status in (301, 302, 303, 307, 308) and response_headers.get("location"):
+                url = urllib.parse.urljoin(url, response_headers["location"])
+                continue
+            break
+
+        if status == 304:
+            logger.debug("Feed {} not modified".format(state.feed_url))
+            return False
+        if status != 200:
+            raise FetchError("HTTP status {}".format(status))
+
+        feed = feedparser.parse(body, response_headers={
+            "content-location": url,
+            "content-type": response_headers.get("content-type", "application/xml"),
+        })
+        if feed.get("bozo") and not feed["entries"]:
+            raise FetchError(feed.get("bozo_exception"))
+        feed["etag"] = response_headers.get("etag")
+        feed["modified"] = response_headers.get("last-modified")
+        state.cache.update(feed)
+        return True
+
+    def _request(self, url, headers, timeout):
+        parts = urllib.parse.urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        # A reused connection may have been closed by the server in the meantime, then try once more with a new one
+        for attempt in range(2):
+            connection, reused = self.connections.get(parts.scheme, parts.netloc, timeout)
+            try:
+                connection.request("GET", path, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            break
+
+        response_headers = {key.lower(): value for key, value in response.getheaders()}
+        if response.will_close:
+            connection.close()
+        else:
+            self.connections.put(parts.scheme, parts.netloc, connection)
+        if response_headers.get("content-encoding") == "gzip":
+            body = gzip.decompress(body)
+        return response.status, response_headers, body
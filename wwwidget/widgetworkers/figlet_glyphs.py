@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import logging
+
+import pyfiglet
+
+logger = logging.getLogger(__name__)
+
+# Characters a clock renders all the time, they are prerendered as soon as a cache is created
+CLOCK_CHARACTERS = "0123456789: APM"
+# Width which is wide enough to never wrap any text
+UNWRAPPED_WIDTH = 10000
+
+# One cache per font and width, shared by all clocks running in the same process
+_glyph_caches = {}
+
+
+def get_glyph_cache(font, width):
+    key = (font, width)
+    if key not in _glyph_caches:
+        _glyph_caches[key] = FigletGlyphCache(font, width)
+    return _glyph_caches[key]
+
+
+class FigletGlyphCache(object):
+    """
+    Renders figlet text by joining prerendered glyphs instead of laying out the whole string with pyfiglet.
+
+    This only works for fonts which put the glyphs next to each other without kerning or smushing them. For all other
+    fonts, and for texts wider than the available width, the text is still rendered by pyfiglet, but at least the font
+    doesn't have to be loaded again.
+    """
+
+    def __init__(self, font, width):
+        self.font = font
+        self.width = width
+        self.figlet = pyfiglet.Figlet(font=font, width=width)
+        self.unwrapped_figlet = pyfiglet.Figlet(font=font, width=UNWRAPPED_WIDTH)
+        self.glyphs = {}
+        for character in CLOCK_CHARACTERS:
+            self.glyph(character)
+        self.joinable = self._render_joined(CLOCK_CHARACTERS) == self._render_unwrapped(CLOCK_CHARACTERS)
+        logger.info("Glyph cache for font {}, width {}: {} glyphs, joinable: {}".format(
+            font, width, len(self.glyphs), self.joinable))
+
+    def glyph(self, character):
+        if character not in self.glyphs:
+            self.glyphs[character] = self.unwrapped_figlet.renderText(character).split("\n")
+        return self.glyphs[character]
+
+    def _render_joined(self, text):
+        return ["".join(glyph_rows) for glyph_rows in zip(*(self.glyph(character) for character in text))]
+
+    def _render_unwrapped(self, text):
+        return self.unwrapped_figlet.renderText(text).split("\n")
+
+    def render(self, text):
+        """Returns the lines pyfiglet.figlet_format(text, font, width) would return"""
+        if self.joinable and text:
+            lines = self._render_joined(text)
+            if len(lines[0]) < self.width:
+                return lines
+        return self.figlet.renderText(text).split("\n")
@@ -1,56 +1,214 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import codecs
+import mmap
+import os
 import random
+import re
+import struct
+import threading
 import logging
 import logging.config
 
+from . import disk_cache
+
 # create logger
 logger = logging.getLogger(__name__)
 
+# A line with nothing but a % separates two fortune cookies
+DELIMITER = re.compile(rb"^[ \t]*%[ \t\r]*$", re.MULTILINE)
+
+# Header of the .dat index files written by strfile(1), all fields in network byte order
+STRFILE_HEADER = struct.Struct(">IIIIIc3x")
+STRFILE_OFFSET = struct.Struct(">I")
+STRFILE_ROTATED = 0x4
+
+# Bump whenever the layout of the cached index or word index changes
+INDEX_VERSION = 2
+
+# Indices and word indices already loaded in this process, keyed by fortune file, modification time and size
+_indices = {}
+_word_indices = {}
+_indices_lock = threading.Lock()
+
+
 class fortune_cookie_loader(object):
-    def __init__(self, fortune_file, max_width = None, max_height = None, search_word = None):
-        self.found_fortune_cookies = []
-        valid_cookies = 0
-        all_cookies = 0
-        with open(fortune_file) as file_in:
-            current_fortune_cookie = []
-            for line in file_in:
-                line = line.strip()
-                if line == '%':
-                    all_cookies += 1
-                    if self.is_fortune_cookie_valid(current_fortune_cookie, max_width, max_height, search_word):
-                        valid_cookies += 1
-                        self.found_fortune_cookies.append(current_fortune_cookie)
-                    current_fortune_cookie = []
-                else:
-                    current_fortune_cookie.append(line)
-        
-        logger.debug("Done. {}/{} Fortune Cookies loaded".format(valid_cookies, all_cookies))
-        
+    """
+    Picks random fortune cookies from a fortune file.
+
+    The file is memory mapped and only a cookie that is picked gets decoded. Which cookies fit max_width and
+    max_height is looked up in an index with the offset, line count and maximum line width of every cookie. The index
+    is built once per fortune file and modification time and cached on disk, the cookie offsets are taken from the
+    strfile .dat index next to the fortune file if there is an up to date one.
+    The words of the cookies, for search_word, are many times the size of that and go to a cache file of their own,
+    which is only loaded if there is a search_word.
+    """
+
+    def __init__(self, fortune_file, max_width = None, max_height = None, search_word = None,
+                 cache_dir = disk_cache.DEFAULT_CACHE_DIR):
+        self.fortune_file = fortune_file
+        self.cache_dir = cache_dir
+        self.rotated = False
+        self.words = None
+
+        with open(fortune_file, "rb") as file_in:
+            stat = os.fstat(file_in.fileno())
+            if stat.st_size:
+                self.fortune_map = mmap.mmap(file_in.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.fortune_map = b""
+
+        self.stat = stat
+        self.index = self.load_index()
+        self.offsets = self.index["offsets"]
+        self.rotated = self.index["rotated"]
+        self.valid_cookies = self.find_valid_cookies(max_width, max_height, search_word)
+
+        logger.debug("Done. {}/{} Fortune Cookies loaded".format(len(self.valid_cookies), len(self.offsets)))
+
+    def load_index(self):
+        """Returns the index of the fortune file from this process, from the disk cache or builds it"""
+        return self.load_cached(_indices, "fortunes", self.build_index)
+
+    def load_words(self):
+        """Returns the word index of the fortune file, word -> indices of the cookies containing it"""
+        return self.load_cached(_word_indices, "fortune_words", self.build_words)["words"]
+
+    def load_cached(self, loaded, namespace, build):
+        key = (os.path.abspath(self.fortune_file), self.stat.st_mtime, self.stat.st_size)
+        # Fortune workers running as threads share the index, and only one of them builds it
+        with _indices_lock:
+            if key in loaded:
+                return loaded[key]
+
+            cache_path = disk_cache.cache_file(self.cache_dir, namespace, key[0])
+            data = disk_cache.load_json(cache_path)
+            if not data or (data.get("version"), data.get("mtime"), data.get("size")) != (INDEX_VERSION,) + key[1:]:
+                data = build()
+                data.update({"version": INDEX_VERSION, "fortune_file": key[0], "mtime": key[1], "size": key[2]})
+                disk_cache.store_json(cache_path, data)
+                logger.debug("Built {} index of {}".format(namespace, self.fortune_file))
+
+            loaded[key] = data
+            return data
+
+    def build_index(self):
+        offsets = self.read_strfile_index()
+        if offsets is None:
+            offsets = self.scan_offsets()
+        self.offsets = offsets
+
+        line_counts = []
+        max_widths = []
+        for cookie_index in range(len(offsets)):
+            cookie = self.read_fortune_cookie(cookie_index)
+            line_counts.append(len(cookie))
+            max_widths.append(max((len(line) for line in cookie), default=0))
+
+        return {"offsets": offsets, "rotated": self.rotated, "line_counts": line_counts, "max_widths": max_widths}
+
+    def build_words(self):
+        words = {}
+        for cookie_index in range(len(self.offsets)):
+            for word in set(" ".join(self.read_fortune_cookie(cookie_index)).split()):
+                words.setdefault(word, []).append(cookie_index)
+        return {"words": words}
+
+    def find_valid_cookies(self, max_width = None, max_height = None, search_word = None):
+        """Returns the indices of all cookies that fit, without decoding any of them unless search_word has spaces"""
+        search_parts = search_word.split() if search_word else []
+        if search_parts:
+            if self.words is None:
+                self.words = self.load_words()
+            # search_word may be part of a word, so look for it in every word the file contains
+            candidates = set()
+            for word, cookie_indices in self.words.items():
+                if search_parts[0] in word:
+                    candidates.update(cookie_indices)
+            candidates = sorted(candidates)
+        else:
+            candidates = range(len(self.offsets))
+
+        line_counts = self.index["line_counts"]
+        max_widths = self.index["max_widths"]
+        valid_cookies = [cookie_index for cookie_index in candidates
+                         if not (max_height and line_counts[cookie_index] > max_height)
+                         and not (max_width and max_widths[cookie_index] > max_width)]
+
+        if search_word and search_parts != [search_word]:
+            valid_cookies = [cookie_index for cookie_index in valid_cookies
+                             if self.is_fortune_cookie_valid(self.read_fortune_cookie(cookie_index),
+                                                             search_word=search_word)]
+        return valid_cookies
+
+    def read_strfile_index(self):
+        """Returns the cookie offsets from the strfile .dat file, or None if there is no usable one"""
+        index_file = self.fortune_file + ".dat"
+        try:
+            if os.path.getmtime(index_file) < os.path.getmtime(self.fortune_file):
+                return None
+            with open(index_file, "rb") as index_in:
+                header = index_in.read(STRFILE_HEADER.size)
+                version, number_of_strings, longest, shortest, flags, delimiter = STRFILE_HEADER.unpack(header)
+                offsets_data = index_in.read(number_of_strings * STRFILE_OFFSET.size)
+        except (OSError, struct.error):
+            return None
+
+        if delimiter != b"%" or len(offsets_data) != number_of_strings * STRFILE_OFFSET.size:
+            return None
+        offsets = [offset for offset, in STRFILE_OFFSET.iter_unpack(offsets_data)]
+        if any(offset > len(self.fortune_map) for offset in offsets):
+            return None
+        self.rotated = bool(flags & STRFILE_ROTATED)
+        return offsets
+
+    def scan_offsets(self):
+        """Returns the offsets of all cookies which are followed by a delimiter"""
+        offsets = []
+        start = 0
+        for delimiter in DELIMITER.finditer(self.fortune_map):
+            offsets.append(start)
+            start = delimiter.end() + 1
+        return offsets
+
+    def read_fortune_cookie(self, index):
+        """Decodes a single cookie into its stripped lines"""
+        start = self.offsets[index]
+        delimiter = DELIMITER.search(self.fortune_map, start)
+        end = delimiter.start() if delimiter else len(self.fortune_map)
+        text = self.fortune_map[start:end].decode("utf-8", errors="replace")
+        if self.rotated:
+            text = codecs.decode(text, "rot13")
+        lines = [line.strip() for line in text.split("\n")]
+        # The newline in front of the delimiter doesn't start another line
+        if lines and not lines[-1]:
+            lines.pop()
+        return lines
+
     def is_fortune_cookie_valid(self, fortune_cookie, max_width = None, max_height = None, search_word = None):
         if max_height:
             if len(fortune_cookie) > max_height:
                 return False
-        
+
         if max_width:
             if any(len(line)>max_width for line in fortune_cookie):
                 return False
-        
+
         if search_word:
             if all((search_word not in line) for line in fortune_cookie):
                 return False
-        
+
         return True
-        
+
     def return_fortune_cookie(self):
-        return random.choice(self.found_fortune_cookies)
-    
-    
-    
+        return self.read_fortune_cookie(random.choice(self.valid_cookies))
+
+
+
 def main():
     f = fortune_cookie_loader("/usr/share/games/fortunes/songs-poems", search_word="Moon")
     print(f.return_fortune_cookie())
     print("---")
-    
-    
-#main()
\ No newline at end of file
+
+
+#main()
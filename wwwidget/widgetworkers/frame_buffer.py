@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Unchanged cells between two changed spans of a row up to this length are resent rather than starting a new addstr
+MAX_UNCHANGED_GAP = 3
+# Bytes an operation costs besides its text, i.e. the cursor movement and attribute change on the terminal
+OPERATION_OVERHEAD = 8
+
+# Operation codes of a frame, integers pickle smaller and compare faster than the names
+CLEAR, BKGD, ADDSTR = 0, 1, 2
+# The names are still accepted from widgets which build their frames as lists
+OPCODES = {"clear": CLEAR, "bkgd": BKGD, "addstr": ADDSTR}
+
+
+class FrameBuffer(object):
+    """
+    Character and attribute grid with the content of one widget.
+
+    Workers render every frame into a FrameBuffer and send only the difference to the last frame they sent, the
+    controller keeps one FrameBuffer per widget as shadow buffer and applies these differences to it.
+    A difference is a list of operation tuples:
+        (CLEAR,)
+        (BKGD, ch, attr)
+        (ADDSTR, y, x, text, attr)
+    Lists with the operation names, e.g. ["addstr", y, x, text, attr], are applied as well.
+    """
+
+    def __init__(self, width, height):
+        self.width = max(width, 0)
+        self.height = max(height, 0)
+        # For the render time of a worker's frame
+        self.created_at = time.perf_counter()
+        self.clear()
+
+    def clear(self):
+        self.rows = [" " * self.width for _ in range(self.height)]
+        self.attrs = [[0] * self.width for _ in range(self.height)]
+        self.background = None
+        self.dirty_rows = set(range(self.height))
+
+    def apply(self, frame):
+        for output in frame:
+            opcode = OPCODES.get(output[0], output[0])
+            if opcode == ADDSTR:
+                self.addstr(*output[1:])
+            elif opcode == BKGD:
+                self.bkgd(*output[1:])
+            elif opcode == CLEAR:
+                self.clear()
+            else:
+                logger.warning("Unknown frame operation {}".format(output))
+
+    def addstr(self, y, x, text, attr=0):
+        """Writes text into the buffer, everything outside of the buffer is clipped"""
+        if not 0 <= y < self.height or x >= self.width:
+            return
+        if "\t" in text:
+            # Like curses, tab stops every 8 columns of the window
+            start = max(x, 0)
+            text = (" " * start + text).expandtabs()[start:]
+        if x < 0:
+            text = text[-x:]
+            x = 0
+        text = text[:self.width - x]
+        if not text:
+            return
+
+        end = x + len(text)
+        row = self.rows[y]
+        new_row = row[:x] + text + row[end:]
+        row_attrs = self.attrs[y]
+        if new_row == row and all(a == attr for a in row_attrs[x:end]):
+            return
+        self.rows[y] = new_row
+        row_attrs[x:end] = [attr] * len(text)
+        self.dirty_rows.add(y)
+
+    def bkgd(self, *parameters):
+        if parameters != self.background:
+            self.background = parameters
+            self.dirty_rows.update(range(self.height))
+
+    def pop_dirty_rows(self):
+        dirty_rows = sorted(self.dirty_rows)
+        self.dirty_rows = set()
+        return dirty_rows
+
+    def row_runs(self, y, start=0, end=None):
+        """Splits a row into (x, text, attr) runs of equal attributes, trailing blanks are left out"""
+        row = self.rows[y]
+        row_attrs = self.attrs[y]
+        if end is None:
+            end = self.width
+            while end > start and row[end - 1] == " " and not row_attrs[end - 1]:
+                end -= 1
+        runs = []
+        x = start
+        while x < end:
+            attr = row_attrs[x]
+            run_end = x + 1
+            while run_end < end and row_attrs[run_end] == attr:
+                run_end += 1
+            runs.append((x, row[x:run_end], attr))
+            x = run_end
+        return runs
+
+    def full_frame(self):
+        """Returns the operations which paint this buffer onto an empty window"""
+        frame = [(CLEAR,)]
+        if self.background is not None:
+            frame.append((BKGD,) + self.background)
+        for y in range(self.height):
+            frame.extend((ADDSTR, y) + run for run in self.row_runs(y))
+        return frame
+
+    def diff(self, previous):
+        """Returns the operations which turn the previous buffer into this one, or a full frame if that is shorter"""
+        if previous is None or (previous.width, previous.height) != (self.width, self.height) \
+                or previous.background != self.background:
+            return self.full_frame()
+
+        frame = []
+        for y in range(self.height):
+            row, previous_row = self.rows[y], previous.rows[y]
+            row_attrs, previous_attrs = self.attrs[y], previous.attrs[y]
+            if row == previous_row and row_attrs == previous_attrs:
+                continue
+            changed = [x for x in range(self.width) if row[x] != previous_row[x] or row_attrs[x] != previous_attrs[x]]
+            span_start = span_end = changed[0]
+            for x in changed[1:]:
+                if x - span_end > MAX_UNCHANGED_GAP + 1:
+                    frame.extend((ADDSTR, y) + run for run in self.row_runs(y, span_start, span_end + 1))
+                    span_start = x
+                span_end = x
+            frame.extend((ADDSTR, y) + run for run in self.row_runs(y, span_start, span_end + 1))
+
+        full_frame = self.full_frame()
+        return frame if frame_size(frame) < frame_size(full_frame) else full_frame
+
+
+def frame_size(frame):
+    """Rough number of bytes a frame costs on its way to the terminal"""
+    return sum(OPERATION_OVERHEAD + (len(output[3]) if output[0] == ADDSTR else 0) for output in frame)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import logging
+import logging.handlers
+import multiprocessing
+import queue
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOG_FILE = "example.log"
+DEFAULT_LOG_LEVEL = "DEBUG"
+# Frames of a widget are logged at most once in this many seconds
+DEFAULT_FRAME_LOG_INTERVAL = 10
+# Records waiting for the log file beyond this are dropped instead of blocking the widget that logs them
+MAX_QUEUED_RECORDS = 10000
+
+_frame_logging = True
+_frame_log_interval = DEFAULT_FRAME_LOG_INTERVAL
+_last_frame_log = {}
+
+
+def configure_frame_logging(enabled, interval=DEFAULT_FRAME_LOG_INTERVAL):
+    global _frame_logging, _frame_log_interval
+    _frame_logging = enabled
+    _frame_log_interval = interval
+
+
+def should_log_frame(widget_name, kind="frame"):
+    """
+    True if a frame of the widget may be logged now: frame logging is on, debug records are written at all and the
+    last one of this kind, e.g. a received frame or a fortune cookie, was logged long enough ago.
+    Check it before formatting the frame.
+    """
+    if not _frame_logging or not logging.getLogger().isEnabledFor(logging.DEBUG):
+        return False
+    now = time.monotonic()
+    last = _last_frame_log.get((widget_name, kind))
+    if last is not None and now - last < _frame_log_interval:
+        return False
+    _last_frame_log[widget_name, kind] = now
+    return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler which drops records when the queue is full instead of blocking, and says so later"""
+
+    def __init__(self, log_queue):
+        logging.handlers.QueueHandler.__init__(self, log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            if self.dropped:
+                self.queue.put_nowait(self.prepare(logging.makeLogRecord({
+                    "name": __name__, "levelno": logging.WARNING, "levelname": "WARNING",
+                    "msg": "Dropped {} log records, the log file can't keep up".format(self.dropped)})))
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def start_logging(config):
+    """
+    Sends the log records of the controller and all widgets through a queue to a background thread, which is the
+    only one writing the log file. A slow SD card then delays that thread, but never a frame.
+    Returns the QueueListener, stop it on exit to write the remaining records.
+    """
+    configure_frame_logging(config.getboolean("wwwidget", "log_frames", fallback=True),
+                            config.getfloat("wwwidget", "frame_log_interval", fallback=DEFAULT_FRAME_LOG_INTERVAL))
+
+    file_handler = logging.FileHandler(config.get("wwwidget", "log_file", fallback=DEFAULT_LOG_FILE), mode="w")
+    file_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s",
+                                                datefmt="%m/%d/%Y %I:%M:%S %p"))
+
+    # A multiprocessing queue, so widgets running as processes log through it as well
+    log_queue = multiprocessing.Queue(MAX_QUEUED_RECORDS)
+    root_logger = logging.getLogger()
+    root_logger.setLevel(config.get("wwwidget", "log_level", fallback=DEFAULT_LOG_LEVEL))
+    root_logger.addHandler(DroppingQueueHandler(log_queue))
+
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+    listener.start()
+    return listener
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+import array
+import logging
+import os
+import struct
+from multiprocessing import reduction
+from multiprocessing import shared_memory
+
+logger = logging.getLogger(__name__)
+
+# sequence, sent_at, render seconds, background character (-1 without background), background attribute, label length
+HEADER = struct.Struct("<QddiII")
+# The sequence and the rest of the header on their own, the sequence is written last
+SEQUENCE = struct.Struct("<Q")
+HEADER_FIELDS = struct.Struct("<ddiII")
+LABEL_SIZE = 256
+# Characters are stored as UTF-32, attributes as unsigned 32 bit integers
+CELL_SIZE = 4
+
+
+class SharedFrame(object):
+    """
+    Character and attribute grid of one widget in shared memory, the alternative to sending frames over the queue.
+
+    The worker writes changed rows directly into the grid and the controller copies them into its shadow buffer, so
+    a frame is neither pickled nor sent through a pipe. The sequence counter is odd while the worker writes, the
+    controller only takes a frame whose counter is even and didn't change while it was copying it.
+    After every frame the worker writes a byte into the doorbell pipe to wake the controller up.
+    """
+
+    def __init__(self, width, height, doorbell):
+        self.width = max(width, 0)
+        self.height = max(height, 0)
+        self.doorbell = doorbell
+        self.shm = shared_memory.SharedMemory(
+            create=True, size=HEADER.size + LABEL_SIZE + 2 * CELL_SIZE * max(self.width * self.height, 1))
+        self.chars_offset = HEADER.size + LABEL_SIZE
+        self.attrs_offset = self.chars_offset + CELL_SIZE * self.width * self.height
+        self.attrs = self.attrs_view()
+        self.sequence = 0
+        # Sequence of the last frame the controller copied
+        self.received_sequence = 0
+        self.write_header(0, 0.0, 0.0, None, "")
+        blank_row = (" " * self.width).encode("utf-32-le")
+        for y in range(self.height):
+            self.write_row(y, blank_row, array.array("I", [0] * self.width))
+
+    def attrs_view(self):
+        return self.shm.buf[self.attrs_offset:self.attrs_offset + CELL_SIZE * self.width * self.height].cast("I")
+
+    def __getstate__(self):
+        # Pickled with a process widget started by spawn or forkserver: the shared memory is attached again by its
+        # name, the doorbell is passed to the new process like the pipes of multiprocessing itself
+        state = self.__dict__.copy()
+        del state["attrs"]
+        state["doorbell"] = reduction.DupFd(self.doorbell)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.doorbell = self.doorbell.detach()
+        self.attrs = self.attrs_view()
+
+    def write_header(self, sequence, sent_at, render_seconds, background, label):
+        """Writes the header and the label, the sequence last: once it is even, all of the frame is there"""
+        label = label.encode("utf-8")[:LABEL_SIZE]
+        if background is None:
+            background_char, background_attr = -1, 0
+        else:
+            ch = background[0]
+            background_char = ord(ch) if isinstance(ch, str) else ch
+            background_attr = background[1] if len(background) > 1 else 0
+        HEADER_FIELDS.pack_into(self.shm.buf, SEQUENCE.size, sent_at, render_seconds, background_char, background_attr,
+                                len(label))
+        self.shm.buf[HEADER.size:HEADER.size + len(label)] = label
+        SEQUENCE.pack_into(self.shm.buf, 0, sequence)
+
+    def write_row(self, y, chars, attrs):
+        start = self.chars_offset + y * self.width * CELL_SIZE
+        self.shm.buf[start:start + len(chars)] = chars
+        self.attrs[y * self.width:(y + 1) * self.width] = attrs
+
+    def publish(self, frame, previous, label, sent_at, render_seconds):
+        """Writes the rows of a FrameBuffer that differ from the previous one, then rings the doorbell"""
+        self.sequence += 1
+        SEQUENCE.pack_into(self.shm.buf, 0, self.sequence)
+        for y in range(self.height):
+            if previous is not None and frame.rows[y] == previous.rows[y] and frame.attrs[y] == previous.attrs[y]:
+                continue
+            self.write_row(y, frame.rows[y].encode("utf-32-le"), array.array("I", frame.attrs[y]))
+        self.sequence += 1
+        self.write_header(self.sequence, sent_at, render_seconds, frame.background, label)
+        try:
+            os.write(self.doorbell, b"\0")
+        except BlockingIOError:
+            # The controller hasn't read the doorbell yet, it will find this frame anyway
+            pass
+
+    def receive(self, frame_buffer):
+        """
+        Copies a new frame into the controller's shadow buffer and marks the changed rows dirty.
+        Returns (label, sent_at, render_seconds, bytes copied, frames overwritten before the controller got to them),
+        or None if there is no new complete frame.
+        """
+        sequence, sent_at, render_seconds, background_char, background_attr, label_length = \
+            HEADER.unpack_from(self.shm.buf, 0)
+        if sequence % 2 or sequence == self.received_sequence:
+            return None
+        label = bytes(self.shm.buf[HEADER.size:HEADER.size + label_length]).decode("utf-8", errors="replace")
+
+        row_size = self.width * CELL_SIZE
+        rows, attrs = [], []
+        for y in range(self.height):
+            start = self.chars_offset + y * row_size
+            rows.append(bytes(self.shm.buf[start:start + row_size]).decode("utf-32-le"))
+            attrs.append(self.attrs[y * self.width:(y + 1) * self.width].tolist())
+
+        if HEADER.unpack_from(self.shm.buf, 0)[0] != sequence:
+            # Torn frame, the worker is writing the next one and will ring the doorbell when it's done
+            return None
+        skipped_frames = (sequence - self.received_sequence) // 2 - 1
+        self.received_sequence = sequence
+
+        changed_rows = 0
+        for y in range(self.height):
+            if rows[y] != frame_buffer.rows[y] or attrs[y] != frame_buffer.attrs[y]:
+                frame_buffer.rows[y] = rows[y]
+                frame_buffer.attrs[y] = attrs[y]
+                frame_buffer.dirty_rows.add(y)
+                changed_rows += 1
+        background = None if background_char < 0 else (chr(background_char), background_attr)
+        if background != frame_buffer.background:
+            frame_buffer.background = background
+            frame_buffer.dirty_rows.update(range(self.height))
+        return label, sent_at, render_seconds, changed_rows * row_size * 2, skipped_frames
+
+    def close(self):
+        """Releases the shared memory, called by the controller when it shuts down"""
+        self.attrs.release()
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
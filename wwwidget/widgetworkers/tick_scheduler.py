@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+import heapq
+import logging
+import math
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# The wall clock can be set while waiting (NTP on a Raspberry Pi without RTC), so never sleep longer than this
+MAX_WAIT_SECONDS = 60
+
+_scheduler = None
+_scheduler_pid = None
+
+
+def get_scheduler():
+    """Returns the scheduler shared by all widgets running in the current process"""
+    global _scheduler, _scheduler_pid
+    # A forked worker process inherits the object, but not the thread behind it
+    if _scheduler is None or _scheduler_pid != os.getpid():
+        _scheduler = TickScheduler()
+        _scheduler_pid = os.getpid()
+    return _scheduler
+
+
+def next_tick(interval, now):
+    """Returns the first wall clock instant after now which is a multiple of interval"""
+    return (math.floor(now / interval) + 1) * interval
+
+
+def tick_interval_for_time_format(time_format, minimum_interval=1):
+    """
+    Returns after how many seconds the output of strftime(time_format) can change, i.e. 1 if the format shows seconds
+    and 60 otherwise. A minimum_interval above that is rounded to a multiple of it.
+    """
+    shows_seconds = any(directive in time_format for directive in ("%S", "%T", "%X", "%c", "%r", "%s", "%f"))
+    granularity = 1 if shows_seconds else 60
+    return max(granularity, int(math.ceil(minimum_interval / granularity)) * granularity)
+
+
+class Subscription(object):
+    def __init__(self, interval, callback):
+        self.interval = interval
+        self.callback = callback
+        self.cancelled = False
+
+
+class TickScheduler(object):
+    """
+    Timer wheel which calls periodic callbacks on wall clock boundaries, e.g. at every full second or minute.
+
+    All callbacks due at the same instant are called together, so the dashboard wakes up once per boundary and not
+    once per widget. The callbacks are called from the scheduler's own thread and have to return quickly.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        # Due instant -> subscriptions due at that instant, and a heap of all due instants
+        self.wheel = {}
+        self.due_instants = []
+        self.thread = None
+
+    def schedule(self, interval, callback):
+        subscription = Subscription(interval, callback)
+        with self.condition:
+            self._add(subscription, next_tick(interval, time.time()))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="TickScheduler", daemon=True)
+                self.thread.start()
+            self.condition.notify()
+        return subscription
+
+    def cancel(self, subscription):
+        with self.condition:
+            subscription.cancelled = True
+
+    def _add(self, subscription, due):
+        if due not in self.wheel:
+            self.wheel[due] = []
+            heapq.heappush(self.due_instants, due)
+        self.wheel[due].append(subscription)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while True:
+                    if not self.due_instants:
+                        self.condition.wait()
+                        continue
+                    due = self.due_instants[0]
+                    remaining = due - time.time()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(min(remaining, MAX_WAIT_SECONDS))
+                heapq.heappop(self.due_instants)
+                subscriptions = [s for s in self.wheel.pop(due) if not s.cancelled]
+                # Reschedule relative to now, if the wall clock jumped ahead the missed ticks are not made up for
+                now = time.time()
+                for subscription in subscriptions:
+                    self._add(subscription, next_tick(subscription.interval, max(now, due)))
+
+            for subscription in subscriptions:
+                try:
+                    subscription.callback()
+                except Exception as e:
+                    logger.error("Tick callback {} failed: {}".format(subscription.callback, e))